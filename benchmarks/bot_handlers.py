@@ -0,0 +1,333 @@
+"""The real handlers of ``bot.py`` end to end, without network or tokens.
+
+``bot`` is imported in a scratch directory with a generated ``configs.ini``:
+the Bot API is a local ``FakeTelegram``, Kandinsky is a ``FakeFusionbrain``,
+DALL·E is a ``FakeOpenai`` and the embeddings are a synthetic store. The run
+
+1. imports ``bot`` (startup time, with the phases the bot logs),
+2. starts ``--games`` games through ``start_word_picking`` and waits for the
+   generation queue to drain through ``from_queue_processing``,
+3. sends ``--guesses`` wrong guesses from ``--threads`` threads to ``guess``,
+4. calls ``top`` and ``scoreboard_final`` for every game,
+5. ends every game with a correct guess and waits for the outbox to drain.
+
+Results are written to ``--output`` as JSON, so runs can be compared:
+``python -m benchmarks.bot_handlers --output bench.json``
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from telebot.types import Message
+
+from benchmarks.fake_fusionbrain import FakeFusionbrain
+from benchmarks.fake_openai import FakeOpenai
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.games_store import percentile
+from models.convert_embeddings import convert
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:TEST"
+# Generous enough that Telegram's limits do not hide the handlers' own cost
+UNLIMITED = {"send_rate": 100_000, "private_rate": 100_000, "group_rpm": 10_000_000}
+
+
+def word(number: int) -> str:
+    # Handlers only accept letters; at least three of them
+    number += 26 * 27
+    letters = ""
+    while number:
+        number, rest = divmod(number, 26)
+        letters = chr(ord("a") + rest) + letters
+    return letters
+
+
+def write_embeddings(directory: str, words: list, dim: int = 50) -> str:
+    rng = np.random.default_rng(0)
+    source = os.path.join(directory, "vectors.txt")
+    with open(source, "w", encoding="utf-8") as file:
+        for text in words:
+            values = " ".join(f"{value:.5f}" for value in rng.standard_normal(dim))
+            file.write(f"{text} {values}\n")
+    path = os.path.join(directory, "embeddings")
+    convert(source, path)
+    return path
+
+
+def write_config(
+    directory: str,
+    args,
+    telegram: FakeTelegram,
+    fusionbrain: FakeFusionbrain,
+    openai: FakeOpenai,
+    embeddings: str,
+):
+    limits = {} if args.telegram_limits else UNLIMITED
+    defaults = {
+        "TEST_TOKEN": TOKEN,
+        "test_bot_name": "bench_bot",
+        "api_url": telegram.api_url,
+        "workers": args.workers,
+        "update_workers": args.threads,
+        "metrics_port": 0,
+        "embeddings_path": embeddings,
+        **limits,
+    }
+    imagegen = {
+        "kandinsky_url": fusionbrain.url,
+        "kandisky_api_key": "bench",
+        "kandinsky_secret_key": "bench",
+        "dalle_api_key": "bench",
+        "dalle_url": openai.base_url,
+        "dalle_rpm": 100_000,
+        "providers": args.providers,
+        "kandinsky_rpm": 100_000,
+        "pregen_stock": 0,
+    }
+    with open(os.path.join(directory, "configs.ini"), "w") as file:
+        sections = (("DEFAULTS", defaults), ("IMAGEGEN", imagegen), ("DATABASE", {}))
+        for section, values in sections:
+            file.write(f"[{section}]\n")
+            file.writelines(f"{key} = {value}\n" for key, value in values.items())
+
+
+def message(message_id: int, chat_id: int, user_id: int, text: str) -> Message:
+    return Message.de_json(
+        {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        }
+    )
+
+
+class Timings:
+    def __init__(self) -> None:
+        self.values: dict[str, list] = {}
+        self.lock = threading.Lock()
+
+    def wrap(self, name: str, func):
+        def inner(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self.lock:
+                    self.values.setdefault(name, []).append(elapsed)
+
+        return inner
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                name: {
+                    "count": len(values),
+                    "p50_ms": percentile(values, 0.5) * 1000,
+                    "p99_ms": percentile(values, 0.99) * 1000,
+                }
+                for name, values in self.values.items()
+            }
+
+
+def wait_until(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def startup_phases(log_path: str) -> dict:
+    phases = {}
+    with open(log_path, encoding="utf-8") as file:
+        for line in file:
+            found = re.search(r"Startup phase (.+): ([\d.]+) ms", line)
+            if found:
+                phases[found[1]] = float(found[2])
+    return phases
+
+
+def count_errors(log_path: str) -> int:
+    with open(log_path, encoding="utf-8") as file:
+        return sum("ERROR" in line for line in file)
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class ScratchBot:
+    """``bot.py`` imported in a temporary directory, wired to the fakes.
+
+    ``bot`` and ``queue_bot`` are the imported modules; ``startup`` is the
+    import time in seconds.
+    """
+
+    def __init__(self, args, words: list):
+        self.directory = tempfile.mkdtemp(prefix="bot-bench-")
+        os.makedirs(os.path.join(self.directory, "database"))
+        embeddings = write_embeddings(self.directory, words)
+
+        self.telegram = FakeTelegram(latency=args.api_latency).start()
+        self.fusionbrain = FakeFusionbrain(
+            generation_time=args.generation_time, latency=args.api_latency
+        ).start()
+        self.openai = FakeOpenai(generation_time=args.generation_time).start()
+        write_config(
+            self.directory, args, self.telegram, self.fusionbrain, self.openai, embeddings
+        )
+
+        os.chdir(self.directory)
+        sys.path.insert(0, ROOT)
+        started = time.perf_counter()
+        import bot
+        import queue_bot
+
+        self.startup = time.perf_counter() - started
+        self.bot = bot
+        self.queue_bot = queue_bot
+
+    @property
+    def log_path(self) -> str:
+        return os.path.join(self.directory, "logs.log")
+
+    def stop(self):
+        # Closing the queue lets the generation workers exit
+        self.queue_bot.queue_db.close()
+        self.bot.outbox.stop()
+        self.bot.bot.stop_bot()
+        self.telegram.stop()
+        self.fusionbrain.stop()
+        self.openai.stop()
+        os.chdir(ROOT)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def run(args) -> dict:
+    random.seed(0)
+    vocabulary = [word(number) for number in range(args.vocabulary)]
+    answers = random.sample(vocabulary, args.games)
+    groups = [-(10**12) - number for number in range(args.games)]
+
+    scratch = ScratchBot(args, vocabulary)
+    bot = scratch.bot
+
+    timings = Timings()
+    bot.from_queue_processing = timings.wrap("from_queue_processing", bot.from_queue_processing)
+    start_word_picking = timings.wrap("start_word_picking", bot.start_word_picking)
+    guess = timings.wrap("guess", bot.guess)
+    top = timings.wrap("top", bot.top)
+    scoreboard_final = timings.wrap("scoreboard_final", bot.scoreboard_final)
+    bot.start_background()
+
+    # Each game is picked by its own player in a private chat
+    started = time.perf_counter()
+    for number, (answer, group_id) in enumerate(zip(answers, groups)):
+        start_word_picking(message(number, 10_000 + number, 10_000 + number, answer), group_id)
+    drained = wait_until(
+        lambda: all((bot.games_db.get(group_id) or [0, 0, ""])[2] for group_id in groups),
+        args.timeout,
+    )
+    queue_seconds = time.perf_counter() - started
+
+    def one_guess(number: int):
+        group_id = random.choice(groups)
+        user_id = 1 + number % args.players
+        guess(message(number, group_id, user_id, f"/guess {random.choice(vocabulary)}"))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        list(executor.map(one_guess, range(args.guesses)))
+    guess_seconds = time.perf_counter() - started
+
+    for number, group_id in enumerate(groups):
+        top(message(number, group_id, 1, "/top 10"))
+        scoreboard_final(group_id)
+    for number, (answer, group_id) in enumerate(zip(answers, groups)):
+        guess(message(number, group_id, 1, f"/guess {answer}"))
+
+    started = time.perf_counter()
+    bot.outbox.drain(timeout=args.timeout)
+    outbox_seconds = time.perf_counter() - started
+
+    handlers = timings.report()
+    guesses = handlers["guess"]
+    result = {
+        "commit": commit(),
+        "created": time.time(),
+        "params": vars(args),
+        "startup": {
+            "seconds": scratch.startup,
+            "phases_ms": startup_phases(scratch.log_path),
+        },
+        "guesses": {
+            "count": args.guesses,
+            "seconds": guess_seconds,
+            "per_second": args.guesses / guess_seconds,
+            "p50_ms": guesses["p50_ms"],
+            "p99_ms": guesses["p99_ms"],
+        },
+        "queue": {
+            "games": args.games,
+            "drained": drained,
+            "seconds": queue_seconds,
+            "games_per_second": args.games / queue_seconds,
+        },
+        "handlers": handlers,
+        "outbox": {"drain_seconds": outbox_seconds, "stats": bot.outbox.stats()},
+        "telegram_requests": dict(scratch.telegram.requests),
+        "fusionbrain_requests": dict(scratch.fusionbrain.requests),
+        "errors": count_errors(scratch.log_path),
+    }
+    scratch.stop()
+    return result
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--games", type=int, default=40)
+    argparser.add_argument("--guesses", type=int, default=20000)
+    argparser.add_argument("--players", type=int, default=500)
+    argparser.add_argument("--threads", type=int, default=16)
+    # Generation workers, as ``workers`` in configs.ini
+    argparser.add_argument("--workers", type=int, default=4)
+    argparser.add_argument("--vocabulary", type=int, default=50000)
+    argparser.add_argument("--api-latency", type=float, default=0.0)
+    argparser.add_argument("--generation-time", type=float, default=0.5)
+    argparser.add_argument("--providers", default="kandinsky, dalle")
+    # Keep the bot's own send limits instead of lifting them
+    argparser.add_argument("--telegram-limits", action="store_true")
+    argparser.add_argument("--timeout", type=float, default=300)
+    argparser.add_argument("--output", default="bench-results.json")
+    args = argparser.parse_args()
+
+    result = run(args)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+    print(
+        f"startup {result['startup']['seconds']:.2f} s | "
+        f"guesses {result['guesses']['per_second']:,.0f}/s p50 {result['guesses']['p50_ms']:.2f} ms "
+        f"p99 {result['guesses']['p99_ms']:.2f} ms | "
+        f"queue {result['queue']['games_per_second']:.2f} games/s | "
+        f"outbox drain {result['outbox']['drain_seconds']:.2f} s | errors {result['errors']}"
+    )
+    print(f"written to {args.output}")
@@ -0,0 +1,147 @@
+"""Stress test of update dispatch: many groups guessing at once.
+
+Feeds thousands of ``/guess`` updates through a bot's ``process_new_updates``
+into a real ``GamesStore`` and checks that every guess was stored and that
+each chat saw its guesses in order. ``--mode stock`` runs the same load on
+telebot's own thread pool for comparison.
+
+Run from the repository root: ``python -m benchmarks.dispatcher --groups 200 --guesses 20000``
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import telebot
+from telebot.types import Update
+
+from database.games import GamesStore
+from dispatcher import ChatDispatcher, DispatchingTeleBot
+
+TOKEN = "123456:TEST"
+
+
+def make_update(update_id: int, chat_id: int, user_id: int, text: str) -> Update:
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            },
+        }
+    )
+
+
+def make_bot(mode: str, workers: int):
+    if mode == "stock":
+        return telebot.TeleBot(TOKEN, threaded=True, num_threads=workers)
+    return DispatchingTeleBot(TOKEN, ChatDispatcher(workers=workers).start())
+
+
+def wait_idle(bot, seen: dict):
+    if isinstance(bot, DispatchingTeleBot):
+        bot.dispatcher.join()
+        return
+    # telebot's pool has no join: wait for the handled count to settle
+    last = -1
+    while True:
+        handled = sum(len(sequence) for sequence in seen.values())
+        if handled == last and bot.worker_pool.tasks.empty():
+            return
+        last = handled
+        time.sleep(0.5)
+
+
+def run(mode: str, groups: int, guesses: int, feeders: int, workers: int, work_ms: float):
+    path = os.path.join(tempfile.mkdtemp(), "games.db")
+    store = GamesStore(path, legacy_path=None)
+    chat_ids = [-(10**12) - i for i in range(groups)]
+    for chat_id in chat_ids:
+        store.upsert(chat_id, ["answer", {}, "file_id", {}, 1, 0])
+
+    seen: dict[int, list] = {chat_id: [] for chat_id in chat_ids}
+    bot = make_bot(mode, workers)
+
+    @bot.message_handler(commands=["guess"])
+    def guess(message):
+        # Stands in for the embedding lookup and the reply
+        time.sleep(work_ms / 1000)
+        sequence = int(message.text.split()[1][1:])
+        store.add_guess(message.chat.id, message.from_user.id, 50.0, f"w{sequence}")
+        seen[message.chat.id].append(sequence)
+
+    # Each feeder plays a getUpdates batch source; a chat's guesses come from
+    # one feeder so their order is well defined
+    def feed(number: int):
+        update_id = number * guesses
+        per_chat = {}
+        batch = []
+        for _ in range(guesses // feeders):
+            chat_id = random.choice(chat_ids[number::feeders])
+            sequence = per_chat.get(chat_id, 0)
+            per_chat[chat_id] = sequence + 1
+            update_id += 1
+            batch.append(
+                make_update(update_id, chat_id, random.randint(1, 50), f"/guess w{sequence}")
+            )
+            if len(batch) == 100:
+                bot.process_new_updates(batch)
+                batch = []
+        bot.process_new_updates(batch)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=feed, args=[n]) for n in range(feeders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wait_idle(bot, seen)
+    elapsed = time.perf_counter() - started
+
+    sent = guesses // feeders * feeders
+    handled = sum(len(sequence) for sequence in seen.values())
+    stored = sum(
+        count for chat_id in chat_ids for count, _ in store.get(chat_id)[3].values()
+    )
+    out_of_order = sum(
+        1
+        for sequence in seen.values()
+        for a, b in zip(sequence, sequence[1:])
+        if b != a + 1
+    )
+    store.close()
+    bot.stop_bot()
+    print(
+        f"{mode:<10} workers {workers:>3} | {sent} guesses in {elapsed:.2f} s "
+        f"({sent / elapsed:,.0f}/s) | handled {handled} | stored {stored} "
+        f"| lost {sent - stored} | out of order {out_of_order}"
+    )
+    return sent - stored, out_of_order
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--mode", choices=("dispatcher", "stock", "both"), default="both")
+    argparser.add_argument("--groups", type=int, default=200)
+    argparser.add_argument("--guesses", type=int, default=20000)
+    argparser.add_argument("--feeders", type=int, default=4)
+    argparser.add_argument("--workers", type=int, default=16)
+    argparser.add_argument("--work-ms", type=float, default=1.0)
+    args = argparser.parse_args()
+
+    modes = ("dispatcher", "stock") if args.mode == "both" else (args.mode,)
+    failed = False
+    for mode in modes:
+        lost, out_of_order = run(
+            mode, args.groups, args.guesses, args.feeders, args.workers, args.work_ms
+        )
+        if mode == "dispatcher" and (lost or out_of_order):
+            failed = True
+    raise SystemExit(1 if failed else 0)
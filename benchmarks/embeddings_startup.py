@@ -0,0 +1,83 @@
+"""Startup time and RSS of ``Embeddings`` with the memory-mapped store vs torchtext.
+
+Each variant runs in a fresh interpreter:
+``python -m benchmarks.embeddings_startup --source .vector_cache/glove.6B.50d.txt``
+
+Without a GloVe file, ``--synthetic 400000`` generates a random one of the same
+shape, which is enough to compare the memory-mapped variants.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from models.convert_embeddings import convert
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from models.embeddings import Embeddings
+embeddings = Embeddings(sys.argv[1])
+embeddings.get_embedding("cat")
+elapsed = time.perf_counter() - started
+rss = 0
+with open("/proc/self/status") as status:
+    for line in status:
+        if line.startswith("VmRSS:"):
+            rss = int(line.split()[1]) * 1024
+print(json.dumps({"seconds": elapsed, "rss": rss, "torch": "torch" in sys.modules}))
+"""
+
+
+def write_synthetic(path: str, words: int, dim: int = 50):
+    rng = np.random.default_rng(0)
+    with open(path, "w", encoding="utf-8") as file:
+        for number in range(words):
+            values = " ".join(f"{value:.5f}" for value in rng.standard_normal(dim))
+            file.write(f"w{number} {values}\n")
+    with open(path, "a", encoding="utf-8") as file:
+        file.write("cat " + " ".join(["0.1"] * dim) + "\n")
+
+
+def probe(path: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, path],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(name: str, result: dict):
+    print(
+        f"{name:<10} startup {result['seconds']:7.3f}s | RSS {result['rss'] / 1024 / 1024:8.1f} MiB"
+        f" | torch imported: {result['torch']}"
+    )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--source", default=None)
+    argparser.add_argument("--synthetic", type=int, default=0)
+    argparser.add_argument("--torchtext", action="store_true")
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = args.source
+        if source is None:
+            source = os.path.join(directory, "glove.txt")
+            write_synthetic(source, args.synthetic or 400_000)
+
+        for name in ("float32", "float16", "int8"):
+            out = os.path.join(directory, name)
+            convert(source, out, name)
+            report(f"mmap {name}", probe(out))
+
+        if args.torchtext:
+            report("torchtext", probe(os.path.join(directory, "missing")))
@@ -0,0 +1,173 @@
+"""Local stand-in for the Fusionbrain (Kandinsky) API.
+
+Implements the three endpoints the clients in ``models`` use. Generations
+finish ``generation_time`` seconds after they are submitted, ``tail_time``
+more for a ``tail_rate`` fraction of them; a fraction of them can be
+censored, and a fraction of requests can be answered with 429/500.
+
+Run standalone with ``python -m benchmarks.fake_fusionbrain --port 8765``.
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 1x1 transparent PNG
+PNG_PIXEL = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+class FakeFusionbrain:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        generation_time: float = 2.0,
+        jitter: float = 0.0,
+        latency: float = 0.0,
+        censored_rate: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limited_rate: float = 0.0,
+        tail_rate: float = 0.0,
+        tail_time: float = 0.0,
+    ) -> None:
+        self.generation_time = generation_time
+        self.jitter = jitter
+        self.latency = latency
+        self.censored_rate = censored_rate
+        self.error_rate = error_rate
+        self.rate_limited_rate = rate_limited_rate
+        self.tail_rate = tail_rate
+        self.tail_time = tail_time
+
+        self.requests = {"models": 0, "run": 0, "status": 0}
+        self.generations: dict[str, tuple[float, bool]] = {}
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), self.__handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; Nagle would hold the body
+            # back for the client's delayed ACK on every kept-alive request
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status: int, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def fail_randomly(self) -> bool:
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if random.random() < fake.rate_limited_rate:
+                    self.reply(429, {"error": "Too Many Requests"})
+                    return True
+                if random.random() < fake.error_rate:
+                    self.reply(500, {"error": "Internal Server Error"})
+                    return True
+                return False
+
+            def do_GET(self):
+                if self.path == "/key/api/v1/models":
+                    with fake.lock:
+                        fake.requests["models"] += 1
+                    if not self.fail_randomly():
+                        self.reply(200, [{"id": 4, "name": "Kandinsky", "version": 3.0}])
+                elif self.path.startswith("/key/api/v1/text2image/status/"):
+                    with fake.lock:
+                        fake.requests["status"] += 1
+                    if self.fail_randomly():
+                        return
+                    request_id = self.path.rsplit("/", 1)[1]
+                    generation = fake.generations.get(request_id)
+                    if generation is None:
+                        self.reply(404, {"error": "Not Found"})
+                    elif time.monotonic() < generation[0]:
+                        self.reply(200, {"uuid": request_id, "status": "PROCESSING"})
+                    else:
+                        self.reply(
+                            200,
+                            {
+                                "uuid": request_id,
+                                "status": "DONE",
+                                "images": [base64.b64encode(PNG_PIXEL).decode()],
+                                "censored": generation[1],
+                            },
+                        )
+                else:
+                    self.reply(404, {"error": "Not Found"})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path != "/key/api/v1/text2image/run":
+                    self.reply(404, {"error": "Not Found"})
+                    return
+                with fake.lock:
+                    fake.requests["run"] += 1
+                if self.fail_randomly():
+                    return
+                request_id = str(uuid.uuid4())
+                ready_at = (
+                    time.monotonic()
+                    + fake.generation_time
+                    + random.uniform(0, fake.jitter)
+                    + (fake.tail_time if random.random() < fake.tail_rate else 0.0)
+                )
+                fake.generations[request_id] = (
+                    ready_at,
+                    random.random() < fake.censored_rate,
+                )
+                self.reply(201, {"uuid": request_id, "status": "INITIAL"})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--port", type=int, default=8765)
+    argparser.add_argument("--generation-time", type=float, default=2.0)
+    argparser.add_argument("--jitter", type=float, default=0.0)
+    args = argparser.parse_args()
+
+    server = FakeFusionbrain(
+        port=args.port, generation_time=args.generation_time, jitter=args.jitter
+    )
+    print(f"Fake Fusionbrain listening on {server.url}")
+    server.server.serve_forever()
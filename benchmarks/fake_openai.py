@@ -0,0 +1,116 @@
+"""Local stand-in for the OpenAI image API (DALL·E).
+
+Answers ``POST /v1/images/generations`` after ``generation_time`` seconds
+(plus up to ``jitter``, plus ``tail_time`` for a ``tail_rate`` fraction) with
+the URL of an image it serves itself. A fraction of requests can be answered
+with 429/500; the attributes may be changed while it runs. Point
+``OpenaiClient`` at it with ``base_url=fake.base_url``.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fake_fusionbrain import PNG_PIXEL
+
+
+class FakeOpenai:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        generation_time: float = 5.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limited_rate: float = 0.0,
+        tail_rate: float = 0.0,
+        tail_time: float = 0.0,
+    ) -> None:
+        self.generation_time = generation_time
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limited_rate = rate_limited_rate
+        self.tail_rate = tail_rate
+        self.tail_time = tail_time
+
+        self.requests = {"generations": 0, "images": 0}
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), self.__handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def base_url(self) -> str:
+        return self.url + "v1"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status: int, body: bytes, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def error(self, status: int, code: str):
+                body = {"error": {"message": code, "type": code, "param": None, "code": code}}
+                self.reply(status, json.dumps(body).encode())
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path != "/v1/images/generations":
+                    return self.error(404, "not_found")
+                with fake.lock:
+                    fake.requests["generations"] += 1
+                if random.random() < fake.rate_limited_rate:
+                    return self.error(429, "rate_limit_exceeded")
+                if random.random() < fake.error_rate:
+                    return self.error(500, "server_error")
+                time.sleep(
+                    fake.generation_time
+                    + random.uniform(0, fake.jitter)
+                    + (fake.tail_time if random.random() < fake.tail_rate else 0.0)
+                )
+                body = {
+                    "created": int(time.time()),
+                    "data": [{"url": f"{fake.url}images/{uuid.uuid4()}.png"}],
+                }
+                self.reply(200, json.dumps(body).encode())
+
+            def do_GET(self):
+                if not self.path.startswith("/images/"):
+                    return self.error(404, "not_found")
+                with fake.lock:
+                    fake.requests["images"] += 1
+                self.reply(200, PNG_PIXEL, "image/png")
+
+        return Handler
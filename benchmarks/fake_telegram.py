@@ -0,0 +1,156 @@
+"""Local stand-in for the Telegram Bot API.
+
+Serves ``getUpdates`` from updates queued with ``push`` (honouring
+``offset``, ``limit`` and long polling), answers ``sendMessage``,
+``sendPhoto`` and ``editMessageText`` with a message, ``getChatMember`` with
+a member and every other method with ``true``. Point telebot at it with
+``telebot.apihelper.API_URL = fake.api_url``.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+class FakeTelegram:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.requests: dict[str, int] = {}
+        self.updates: list[dict] = []
+        self.cond = threading.Condition()
+        self.message_id = 0
+
+        self.server = ThreadingHTTPServer((host, port), self.__handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def api_url(self) -> str:
+        return self.url + "bot{0}/{1}"
+
+    def push(self, updates: list):
+        with self.cond:
+            self.updates.extend(updates)
+            self.cond.notify_all()
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def get_updates(self, offset: int, limit: int, timeout: float) -> list:
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            # Confirmed updates are dropped, as Telegram does
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates and time.monotonic() < deadline:
+                self.cond.wait(deadline - time.monotonic())
+            return self.updates[:limit]
+
+    def send_message(self, params: dict) -> dict:
+        with self.cond:
+            self.message_id += 1
+            message_id = self.message_id
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "supergroup"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    def send_photo(self, params: dict) -> dict:
+        message = self.send_message(params)
+        del message["text"]
+        message["caption"] = params.get("caption", "")
+        file_id = f"photo{message['message_id']}"
+        message["photo"] = [
+            {
+                "file_id": f"{file_id}-{size}",
+                "file_unique_id": f"{file_id}-{size}",
+                "width": size,
+                "height": size,
+            }
+            for size in (90, 320, 1024)
+        ]
+        return message
+
+    def chat_member(self, params: dict) -> dict:
+        user_id = int(params.get("user_id", 0))
+        return {
+            "status": "member",
+            "user": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        }
+
+    def __handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; Nagle would hold the body
+            # back for the client's delayed ACK on every kept-alive request
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, result):
+                body = json.dumps({"ok": True, "result": result}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def handle_method(self):
+                parts = urlsplit(self.path)
+                method = parts.path.rsplit("/", 1)[-1]
+                params = dict(parse_qsl(parts.query))
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.headers.get("Content-Type", "").startswith(
+                    "application/x-www-form-urlencoded"
+                ):
+                    params.update(parse_qsl(body.decode()))
+                with fake.cond:
+                    fake.requests[method] = fake.requests.get(method, 0) + 1
+
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if method == "getUpdates":
+                    return self.reply(
+                        fake.get_updates(
+                            int(params.get("offset") or 0),
+                            int(params.get("limit") or 100),
+                            float(params.get("timeout") or 0),
+                        )
+                    )
+                if method == "getMe":
+                    return self.reply(BOT_USER)
+                if method in ("sendMessage", "editMessageText"):
+                    return self.reply(fake.send_message(params))
+                if method == "sendPhoto":
+                    return self.reply(fake.send_photo(params))
+                if method == "getChatMember":
+                    return self.reply(fake.chat_member(params))
+                self.reply(True)
+
+            do_GET = handle_method
+            do_POST = handle_method
+
+        return Handler
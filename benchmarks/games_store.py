@@ -0,0 +1,110 @@
+"""Guess latency of the game store with many concurrent games.
+
+Run from the repository root: ``python -m benchmarks.games_store --games 10000``
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import tempfile
+import threading
+import time
+
+from database.games import GamesStore
+
+
+def random_word(length: int = 6) -> str:
+    return "".join(random.choices(string.ascii_lowercase, k=length))
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_guesses(store, chat_ids: list, guesses: int, latencies: list):
+    local = []
+    for _ in range(guesses):
+        chat_id = random.choice(chat_ids)
+        started = time.perf_counter()
+        store.add_guess(chat_id, random.randint(1, 50), 42.0, random_word())
+        local.append(time.perf_counter() - started)
+    latencies.extend(local)
+
+
+def bench_store(games: int, guesses: int, threads: int, path: str) -> list:
+    store = GamesStore(path, legacy_path=None)
+    chat_ids = [-(10**12) - i for i in range(games)]
+    for chat_id in chat_ids:
+        store.upsert(chat_id, [random_word(), {}, "file_id", {}, 1])
+
+    latencies = []
+    workers = [
+        threading.Thread(
+            target=run_guesses, args=[store, chat_ids, guesses // threads, latencies]
+        )
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    store.close()
+    return latencies
+
+
+def bench_tinydb(games: int, guesses: int, path: str) -> list:
+    from tinydb import TinyDB, Query
+
+    db = TinyDB(path)
+    User = Query()
+    db.insert_multiple(
+        {"id": str(-(10**12) - i), "data": [random_word(), {}, "file_id", {}, 1]}
+        for i in range(games)
+    )
+
+    latencies = []
+    for _ in range(guesses):
+        chat_id = str(-(10**12) - random.randrange(games))
+        started = time.perf_counter()
+        data = db.search(User.id == chat_id)[0]["data"]
+        data[1][random_word()] = "42.0%"
+        db.upsert({"id": chat_id, "data": data}, User.id == chat_id)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    print(
+        f"{name:<8} guesses: {len(latencies):>7} | "
+        f"mean {statistics.mean(latencies) * 1e6:9.1f} us | "
+        f"p50 {percentile(latencies, 0.5) * 1e6:9.1f} us | "
+        f"p99 {percentile(latencies, 0.99) * 1e6:9.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--games", type=int, default=10_000)
+    argparser.add_argument("--guesses", type=int, default=100_000)
+    argparser.add_argument("--threads", type=int, default=8)
+    argparser.add_argument("--tinydb-guesses", type=int, default=50)
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report(
+            "store",
+            bench_store(
+                args.games, args.guesses, args.threads, os.path.join(directory, "games.db")
+            ),
+        )
+        try:
+            report(
+                "tinydb",
+                bench_tinydb(
+                    args.games, args.tinydb_guesses, os.path.join(directory, "games.json")
+                ),
+            )
+        except ImportError:
+            print("tinydb is not installed, skipping the baseline")
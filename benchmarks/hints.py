@@ -0,0 +1,62 @@
+"""Recall and query latency of the exact and LSH nearest-neighbour indexes.
+
+Uses the converted GloVe store when ``--store`` is given, otherwise a clustered
+synthetic table of the same shape:
+``python -m benchmarks.hints --store models/data/glove.6B.50d``
+"""
+import argparse
+import time
+
+import numpy as np
+
+from models.convert_embeddings import normalize
+from models.neighbours import ExactIndex, LSHIndex
+
+
+def synthetic(rows: int, dim: int = 50, clusters: int = 2000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    noise = rng.standard_normal((rows, dim)).astype(np.float32) * 0.6
+    return normalize(centres[labels] + noise)
+
+
+def measure(index, vectors, queries, truth, k: int) -> tuple[float, float]:
+    recalls = []
+    started = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        rows, _ = index.search(vectors[query], k)
+        recalls.append(len(set(rows.tolist()) & expected) / k)
+    return float(np.mean(recalls)), (time.perf_counter() - started) / len(queries)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--store", default=None)
+    argparser.add_argument("--rows", type=int, default=400_000)
+    argparser.add_argument("--queries", type=int, default=100)
+    argparser.add_argument("-k", type=int, default=10)
+    args = argparser.parse_args()
+
+    if args.store:
+        vectors = np.load(args.store + ".vectors.npy", mmap_mode="r")
+    else:
+        vectors = synthetic(args.rows)
+
+    rng = np.random.default_rng(1)
+    queries = rng.integers(0, len(vectors), args.queries)
+
+    exact = ExactIndex(vectors)
+    truth = [set(exact.search(vectors[q], args.k)[0].tolist()) for q in queries]
+    recall, latency = measure(exact, vectors, queries, truth, args.k)
+    print(f"exact                      recall@{args.k} {recall:.3f} | {latency * 1000:7.2f} ms/query")
+
+    for bits, tables, probes in ((16, 4, 0), (14, 8, 0), (14, 8, 1), (12, 16, 1)):
+        started = time.perf_counter()
+        index = LSHIndex(vectors, bits=bits, tables=tables, probes=probes)
+        build = time.perf_counter() - started
+        recall, latency = measure(index, vectors, queries, truth, args.k)
+        print(
+            f"lsh bits={bits:<2} tables={tables:<2} probes={probes} "
+            f"recall@{args.k} {recall:.3f} | {latency * 1000:7.2f} ms/query | build {build:.1f}s"
+        )
@@ -0,0 +1,70 @@
+"""Time-to-image of the threaded and the asyncio Kandinsky clients.
+
+Both clients run against the local fake Fusionbrain server, so no API keys are
+needed: ``python -m benchmarks.kandinsky_client --requests 50``
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_fusionbrain import FakeFusionbrain
+from models.kandinsky import KandinskyClient
+from models.kandinsky_async import AsyncKandinskyClient
+
+
+def run(client, requests: int, threads: int) -> dict:
+    durations = []
+    statuses = []
+
+    def one(number: int):
+        started = time.perf_counter()
+        status, _ = client.generate_image(f"word{number}")
+        durations.append(time.perf_counter() - started)
+        statuses.append(status)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(one, range(requests)))
+    return {
+        "wall": time.perf_counter() - started,
+        "p50": statistics.median(durations),
+        "max": max(durations),
+        "ok": statuses.count(200),
+    }
+
+
+def report(name: str, result: dict, fake: FakeFusionbrain):
+    print(
+        f"{name:<6} wall {result['wall']:6.2f}s | time-to-image p50 {result['p50']:6.2f}s "
+        f"max {result['max']:6.2f}s | ok {result['ok']} | http {fake.requests}"
+    )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--requests", type=int, default=50)
+    argparser.add_argument("--threads", type=int, default=4)
+    argparser.add_argument("--generation-time", type=float, default=2.0)
+    argparser.add_argument("--jitter", type=float, default=1.0)
+    argparser.add_argument("--sync-poll-delay", type=float, default=10.0)
+    args = argparser.parse_args()
+
+    with FakeFusionbrain(
+        generation_time=args.generation_time, jitter=args.jitter
+    ) as fake:
+        sync_client = KandinskyClient(fake.url, "key", "secret")
+        original_check = sync_client.check_generation
+        sync_client.check_generation = lambda request_id: original_check(
+            request_id, delay=args.sync_poll_delay
+        )
+        report("sync", run(sync_client, args.requests, args.threads), fake)
+
+    with FakeFusionbrain(
+        generation_time=args.generation_time, jitter=args.jitter
+    ) as fake:
+        async_client = AsyncKandinskyClient(fake.url, "key", "secret")
+        # The async client only needs callers to wait, not to poll, so the
+        # caller pool can be as wide as the number of requests
+        report("async", run(async_client, args.requests, args.requests), fake)
+        async_client.close()
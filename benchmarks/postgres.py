@@ -0,0 +1,142 @@
+"""Registration and credit writes: the old one-connection client vs PostgreClient.
+
+Simulates ``/start`` calls (mostly from users who already registered) and
+credit changes from several handler threads. Needs a throwaway database: the
+``users`` table in it is dropped and re-created for each run.
+
+Run from the repository root:
+``python -m benchmarks.postgres --host localhost --dbname bench --user postgres --password secret``
+"""
+import argparse
+import random
+import threading
+import time
+
+import psycopg2
+
+from benchmarks.games_store import percentile
+from database.database import PostgreClient
+
+
+class LegacyClient:
+    """The previous client: one connection, check-then-insert, commit per call."""
+
+    def __init__(self, dsn: str) -> None:
+        self.conn = psycopg2.connect(dsn)
+        self.cur = self.conn.cursor()
+        # The shared cursor was never safe to use from several threads
+        self.lock = threading.Lock()
+
+    def add_user_if_not_exists(self, user_id):
+        with self.lock:
+            self.cur.execute("SELECT COUNT(*) FROM users WHERE user_id = %s", (user_id,))
+            if self.cur.fetchone()[0] == 0:
+                self.cur.execute("INSERT INTO users (user_id) VALUES (%s)", (user_id,))
+                self.conn.commit()
+
+    def add_credits_to_user(self, user_id, credits_to_add):
+        with self.lock:
+            self.cur.execute(
+                "UPDATE users SET credits = credits + %s WHERE user_id = %s",
+                (credits_to_add, user_id),
+            )
+            self.conn.commit()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.conn.close()
+
+
+def reset_table(dsn: str):
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS users")
+        cur.execute(
+            """
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY,
+            timestamp_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            credits INTEGER DEFAULT 0
+        );
+        """
+        )
+    conn.close()
+
+
+def check_totals(dsn: str) -> tuple:
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*), COALESCE(SUM(credits), 0) FROM users")
+        totals = cur.fetchone()
+    conn.close()
+    return totals
+
+
+def run(name: str, client, calls: int, users: int, threads: int, credit_share: float):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        local = []
+        registered = []
+        for _ in range(calls // threads):
+            started = time.perf_counter()
+            if registered and rng.random() < credit_share:
+                client.add_credits_to_user(rng.choice(registered), 1)
+            else:
+                user_id = rng.randint(1, users)
+                client.add_user_if_not_exists(user_id)
+                registered.append(user_id)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=[n]) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    client.flush()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<8} {len(latencies)} calls in {elapsed:.2f} s ({len(latencies) / elapsed:,.0f}/s) "
+        f"| call p50 {percentile(latencies, 0.5) * 1e6:.0f} us p99 {percentile(latencies, 0.99) * 1e6:.0f} us"
+    )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--host", default="localhost")
+    argparser.add_argument("--dbname", default="bench")
+    argparser.add_argument("--user", default="postgres")
+    argparser.add_argument("--password", default="")
+    argparser.add_argument("--calls", type=int, default=20000)
+    argparser.add_argument("--users", type=int, default=2000)
+    argparser.add_argument("--threads", type=int, default=8)
+    # Credits are only added to registered users, like the bot does
+    argparser.add_argument("--credit-share", type=float, default=0.2)
+    # Start with an empty table, so most /start calls register someone new
+    argparser.add_argument("--cold", action="store_true")
+    args = argparser.parse_args()
+    dsn = f"host={args.host} dbname={args.dbname} user={args.user} password={args.password}"
+
+    reset_table(dsn)
+    legacy = LegacyClient(dsn)
+    for user_id in range(1, 0 if args.cold else args.users + 1):
+        legacy.add_user_if_not_exists(user_id)
+    run("legacy", legacy, args.calls, args.users, args.threads, args.credit_share)
+    legacy.close()
+    print(f"         users, credits: {check_totals(dsn)}")
+
+    reset_table(dsn)
+    pooled = PostgreClient(args.host, args.dbname, args.user, args.password)
+    for user_id in range(1, 0 if args.cold else args.users + 1):
+        pooled.add_user_if_not_exists(user_id)
+    pooled.flush()
+    run("pooled", pooled, args.calls, args.users, args.threads, args.credit_share)
+    pooled.close()
+    print(f"         users, credits: {check_totals(dsn)}")
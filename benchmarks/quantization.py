@@ -0,0 +1,69 @@
+"""Memory, similarity throughput and score error of quantised embeddings.
+
+The error column is the largest difference, in percentage points, between the
+percentage players are shown (``round(score * 100, 2)``) with a quantised
+store and with the float32 one:
+``python -m benchmarks.quantization --source .vector_cache/glove.6B.50d.txt``
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.embeddings_startup import write_synthetic
+from models.convert_embeddings import convert
+from models.embeddings import Embeddings
+
+
+def shown(scores: np.ndarray) -> np.ndarray:
+    return np.round(scores.astype(np.float64) * 100, 2)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--source", default=None)
+    argparser.add_argument("--synthetic", type=int, default=400_000)
+    argparser.add_argument("--answers", type=int, default=200)
+    argparser.add_argument("--guesses", type=int, default=500)
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = args.source
+        if source is None:
+            source = os.path.join(directory, "glove.txt")
+            write_synthetic(source, args.synthetic)
+
+        stores = {}
+        for dtype in ("float32", "float16", "int8"):
+            convert(source, os.path.join(directory, dtype), dtype)
+            stores[dtype] = Embeddings(os.path.join(directory, dtype))
+
+        rng = np.random.default_rng(0)
+        vocabulary = len(stores["float32"].words)
+        words = [
+            stores["float32"].word(int(row))
+            for row in rng.integers(0, vocabulary, args.answers + args.guesses)
+        ]
+        answers, guesses = words[: args.answers], words[args.answers :]
+
+        reference = None
+        for dtype, embeddings in stores.items():
+            started = time.perf_counter()
+            scores = np.stack([embeddings.similarities(a, guesses) for a in answers])
+            elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for guess in guesses:
+                embeddings.similarity.__wrapped__(answers[0], guess)
+            single = (time.perf_counter() - started) / len(guesses)
+
+            if reference is None:
+                reference = scores
+            error = np.nanmax(np.abs(shown(scores) - shown(reference)))
+            print(
+                f"{dtype:<8} matrix {embeddings.vectors.nbytes / 1024 / 1024:7.1f} MiB | "
+                f"batched {scores.size / elapsed / 1e6:6.2f} M pairs/s | "
+                f"single {single * 1e6:6.1f} us | max shown error {error:.2f} pp"
+            )
@@ -0,0 +1,252 @@
+"""Replays a recording made by ``capture.UpdateRecorder`` against a new build.
+
+The bot is imported as in ``benchmarks.bot_handlers`` (fake Bot API, fake
+Kandinsky and DALL·E, synthetic embeddings that also contain every word of
+the recording) and polls the fake Bot API as in production. Updates are handed
+to the fake at their recorded times divided by ``--speed``; idle gaps longer
+than ``--max-gap`` seconds of recording are cut short.
+
+The report follows the generation queue and the game store through the run:
+intake lag, queue depth, running games, outbox backlog, handler latencies and
+how long everything took to settle after the last update. It is written to
+``--output`` as JSON.
+
+``python -m benchmarks.replay capture.jsonl.gz --speed 10 --output replay.json``
+"""
+import argparse
+import json
+import re
+import threading
+import time
+
+from benchmarks.bot_handlers import ScratchBot, commit, count_errors, word
+from benchmarks.fake_telegram import BOT_USER
+from benchmarks.games_store import percentile
+from capture import read_recording
+
+
+def load(path: str, max_gap: float) -> tuple[list, list, float]:
+    """Updates renumbered from 1, their offsets in seconds, recorded span."""
+    updates, offsets = [], []
+    previous = None
+    offset = 0.0
+    for recorded, update in read_recording(path):
+        if previous is not None:
+            offset += min(max(recorded - previous, 0.0), max_gap)
+        previous = recorded
+        update["update_id"] = len(updates) + 1
+        for field in ("message", "edited_message"):
+            if field in update:
+                point_at_fake_bot(update[field])
+        updates.append(update)
+        offsets.append(offset)
+    return updates, offsets, offset
+
+
+def point_at_fake_bot(value):
+    # Replies to the bot are guesses; they must look like replies to the fake
+    if isinstance(value, list):
+        for item in value:
+            point_at_fake_bot(item)
+    elif isinstance(value, dict):
+        if value.get("is_bot"):
+            value.update(BOT_USER)
+        for item in value.values():
+            point_at_fake_bot(item)
+
+
+def recorded_words(updates: list) -> list:
+    words = {}
+    for update in updates:
+        message = update.get("message") or update.get("edited_message") or {}
+        for found in re.findall(r"[a-zA-Z]+", message.get("text", "")):
+            words[found.lower()] = None
+    return list(words)
+
+
+class Monitor:
+    """Samples the bot every ``interval`` and times each update's intake."""
+
+    def __init__(self, scratch: ScratchBot, interval: float = 0.5):
+        self.scratch = scratch
+        self.interval = interval
+        self.pushed: dict[int, float] = {}
+        self.lags: list[float] = []
+        self.samples: list[list] = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def push(self, updates: list):
+        now = time.monotonic()
+        with self.lock:
+            for update in updates:
+                self.pushed[update["update_id"]] = now
+        self.scratch.telegram.push(updates)
+
+    def __run(self):
+        bot, queue_bot = self.scratch.bot, self.scratch.queue_bot
+        sampled = 0.0
+        while not self.stopped.wait(0.01):
+            now = time.monotonic()
+            confirmed = bot.bot.last_update_id
+            with self.lock:
+                for update_id in [i for i in self.pushed if i <= confirmed]:
+                    self.lags.append(now - self.pushed.pop(update_id))
+            if now - sampled >= self.interval:
+                sampled = now
+                pool = queue_bot.get_pool_stats()
+                self.samples.append(
+                    [
+                        round(now - self.started, 3),
+                        queue_bot.get_queue_length(),
+                        pool.get("busy_workers", 0),
+                        bot.outbox.pending(),
+                        len(bot.games_db.ids()),
+                        bot.bot.dispatcher.stats()["pending"],
+                    ]
+                )
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def wait_until(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def handler_latencies(histogram) -> dict:
+    result = {}
+    for key, (counts, total) in histogram.series().items():
+        labels = dict(zip(histogram.labels, key))
+        result[labels["handler"]] = {
+            "count": sum(counts),
+            "avg_ms": total / sum(counts) * 1000,
+            "p50_ms": histogram.quantile(0.5, **labels) * 1000,
+            "p95_ms": histogram.quantile(0.95, **labels) * 1000,
+        }
+    return result
+
+
+def run(args) -> dict:
+    updates, offsets, recorded_seconds = load(args.recording, args.max_gap)
+    if not updates:
+        raise SystemExit(f"{args.recording}: no updates")
+    words = [word(number) for number in range(args.vocabulary)] + recorded_words(updates)
+    scratch = ScratchBot(args, list(dict.fromkeys(words)))
+    bot = scratch.bot
+    bot.start_background()
+    threading.Thread(
+        target=bot.bot.infinity_polling,
+        kwargs={"timeout": 10, "long_polling_timeout": 1},
+        daemon=True,
+    ).start()
+
+    monitor = Monitor(scratch).start()
+    started = time.monotonic()
+    position = 0
+    while position < len(updates):
+        due = started + offsets[position] / args.speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        # Everything already due goes in one batch, as Telegram would return it
+        end = position
+        now = time.monotonic() - started
+        while end < len(updates) and offsets[end] / args.speed <= now:
+            end += 1
+        monitor.push(updates[position:end])
+        position = end
+    pushed_seconds = time.monotonic() - started
+
+    fetched = wait_until(lambda: bot.bot.last_update_id >= len(updates), args.timeout)
+    bot.bot.dispatcher.join()
+    handled_seconds = time.monotonic() - started
+    drained = wait_until(
+        lambda: scratch.queue_bot.get_queue_length() == 0, args.timeout
+    )
+    bot.outbox.drain(timeout=args.timeout)
+    settled_seconds = time.monotonic() - started
+    monitor.stop()
+
+    samples = monitor.samples
+    result = {
+        "commit": commit(),
+        "created": time.time(),
+        "params": vars(args),
+        "updates": len(updates),
+        "recorded_seconds": recorded_seconds,
+        "scheduled_seconds": recorded_seconds / args.speed,
+        "pushed_seconds": pushed_seconds,
+        "handled_seconds": handled_seconds,
+        "settled_seconds": settled_seconds,
+        "fetched": fetched,
+        "queue_drained": drained,
+        "intake_lag": {
+            "p50_ms": percentile(monitor.lags, 0.5) * 1000,
+            "p99_ms": percentile(monitor.lags, 0.99) * 1000,
+            "max_ms": max(monitor.lags) * 1000,
+        }
+        if monitor.lags
+        else None,
+        "max": {
+            "queue_depth": max((sample[1] for sample in samples), default=0),
+            "outbox_pending": max((sample[3] for sample in samples), default=0),
+            "games": max((sample[4] for sample in samples), default=0),
+            "dispatcher_pending": max((sample[5] for sample in samples), default=0),
+        },
+        "handlers": handler_latencies(bot.HANDLER_LATENCY),
+        "generations": {
+            "/".join(map(str, key)): value for key, value in bot.GENERATIONS.values().items()
+        },
+        "telegram_requests": dict(scratch.telegram.requests),
+        "errors": count_errors(scratch.log_path),
+        # [seconds, queue length, busy workers, outbox pending, games, dispatcher pending]
+        "timeline": samples,
+    }
+    scratch.stop()
+    return result
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("recording")
+    argparser.add_argument("--speed", type=float, default=1.0)
+    argparser.add_argument("--max-gap", type=float, default=60.0)
+    argparser.add_argument("--threads", type=int, default=16)
+    # Generation workers, as ``workers`` in configs.ini
+    argparser.add_argument("--workers", type=int, default=4)
+    # Filler words besides the ones in the recording
+    argparser.add_argument("--vocabulary", type=int, default=50000)
+    argparser.add_argument("--api-latency", type=float, default=0.0)
+    argparser.add_argument("--generation-time", type=float, default=5.0)
+    argparser.add_argument("--providers", default="kandinsky, dalle")
+    argparser.add_argument("--telegram-limits", action="store_true")
+    argparser.add_argument("--timeout", type=float, default=600)
+    argparser.add_argument("--output", default="replay-results.json")
+    args = argparser.parse_args()
+
+    result = run(args)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+    lag = result["intake_lag"] or {"p50_ms": 0, "p99_ms": 0}
+    print(
+        f"{result['updates']} updates, {result['recorded_seconds']:.0f} s recorded at "
+        f"{args.speed:g}x: pushed in {result['pushed_seconds']:.1f} s, handled by "
+        f"{result['handled_seconds']:.1f} s, settled by {result['settled_seconds']:.1f} s | "
+        f"intake lag p50 {lag['p50_ms']:.1f} ms p99 {lag['p99_ms']:.1f} ms | "
+        f"max queue {result['max']['queue_depth']} | max games {result['max']['games']} | "
+        f"errors {result['errors']}"
+    )
+    print(f"written to {args.output}")
@@ -0,0 +1,104 @@
+"""Time-to-image with Kandinsky alone vs the hedging provider router.
+
+Both providers are local fakes with a heavy tail: most generations take
+about ``--generation-time`` seconds, ``--tail-rate`` of them ``--tail-time``
+longer. In the outage scenario Kandinsky answers every request with 429
+for the middle third of the run.
+
+``python -m benchmarks.router --scenario both``
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_fusionbrain import FakeFusionbrain
+from benchmarks.fake_openai import FakeOpenai
+from benchmarks.games_store import percentile
+from models.dalle import OpenaiClient
+from models.kandinsky_async import AsyncKandinskyClient
+from models.router import ProviderRouter
+
+
+def run(generate, requests: int, concurrency: int, outage=None) -> dict:
+    durations = []
+    statuses: dict = {}
+
+    def one(number: int):
+        if outage is not None:
+            outage(number)
+        started = time.perf_counter()
+        status, _ = generate(f"word{number}")
+        durations.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    return {"durations": durations, "statuses": statuses}
+
+
+def report(name: str, result: dict, extra: str = ""):
+    durations = result["durations"]
+    print(
+        f"{name:<22} p50 {percentile(durations, 0.5):6.2f} s | p95 {percentile(durations, 0.95):6.2f} s"
+        f" | p99 {percentile(durations, 0.99):6.2f} s | max {max(durations):6.2f} s"
+        f" | statuses {result['statuses']}{extra}"
+    )
+
+
+def scenario(args, outage: bool):
+    fusionbrain = FakeFusionbrain(
+        generation_time=args.generation_time,
+        tail_rate=args.tail_rate,
+        tail_time=args.tail_time,
+    ).start()
+    openai = FakeOpenai(
+        generation_time=args.generation_time * 1.5,
+        tail_rate=args.tail_rate,
+        tail_time=args.tail_time,
+    ).start()
+    kandinsky = AsyncKandinskyClient(fusionbrain.url, "bench", "bench")
+    dalle = OpenaiClient("bench", base_url=openai.base_url)
+
+    def toggle(number: int):
+        third = args.requests // 3
+        fusionbrain.rate_limited_rate = 1.0 if third <= number < 2 * third else 0.0
+
+    title = "outage" if outage else "tail"
+    single = run(
+        kandinsky.generate_image, args.requests, args.concurrency, toggle if outage else None
+    )
+    report(f"{title}: kandinsky only", single)
+
+    router = ProviderRouter(cooldown=args.cooldown)
+    router.add("kandinsky", kandinsky.generate_image).add("dalle", dalle.generate_image)
+    routed = run(router.generate_image, args.requests, args.concurrency, toggle if outage else None)
+    stats = router.stats()
+    providers = {name: value["requests"] for name, value in stats["providers"].items()}
+    report(
+        f"{title}: router",
+        routed,
+        f" | hedges {stats['hedges']} (won {stats['hedge_wins']}) | failovers {stats['failovers']}"
+        f" | calls {providers}",
+    )
+
+    router.close()
+    kandinsky.close()
+    fusionbrain.stop()
+    openai.stop()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--scenario", choices=("tail", "outage", "both"), default="both")
+    argparser.add_argument("--requests", type=int, default=150)
+    argparser.add_argument("--concurrency", type=int, default=4)
+    argparser.add_argument("--generation-time", type=float, default=1.0)
+    argparser.add_argument("--tail-rate", type=float, default=0.03)
+    argparser.add_argument("--tail-time", type=float, default=10.0)
+    argparser.add_argument("--cooldown", type=float, default=5.0)
+    args = argparser.parse_args()
+
+    if args.scenario in ("tail", "both"):
+        scenario(args, outage=False)
+    if args.scenario in ("outage", "both"):
+        scenario(args, outage=True)
@@ -0,0 +1,158 @@
+"""Update intake: webhook server vs one getUpdates polling loop.
+
+In webhook mode ``--clients`` threads POST synthetic updates to a local
+``WebhookServer``; in polling mode the same updates are served by a fake Bot
+API and fetched with ``getUpdates`` the way ``infinity_polling`` does. Both
+feed the same dispatching bot, and the run ends when every update has been
+handled.
+
+Run from the repository root: ``python -m benchmarks.webhook --updates 20000``
+"""
+import argparse
+import threading
+import time
+
+import requests
+import telebot
+
+from benchmarks.dispatcher import TOKEN
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.games_store import percentile
+from dispatcher import ChatDispatcher, DispatchingTeleBot
+from webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "bench-secret"
+
+
+def update_json(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+            "from": {"id": update_id % 50 + 1, "is_bot": False, "first_name": "u"},
+            "text": f"guess w{update_id}",
+        },
+    }
+
+
+def make_bot(workers: int, work_ms: float):
+    bot = DispatchingTeleBot(TOKEN, ChatDispatcher(workers=workers).start())
+    handled = set()
+    lock = threading.Lock()
+
+    @bot.message_handler(content_types=["text"])
+    def on_text(message):
+        time.sleep(work_ms / 1000)
+        with lock:
+            handled.add(message.message_id)
+
+    return bot, handled
+
+
+def wait_handled(handled: set, expected: int, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while len(handled) < expected and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def run_webhook(updates: int, groups: int, clients: int, workers: int, work_ms: float, max_pending: int):
+    bot, handled = make_bot(workers, work_ms)
+    server = WebhookServer(
+        bot, host="127.0.0.1", port=0, secret_token=SECRET, max_pending=max_pending
+    ).start()
+    host, port = server.address
+    url = f"http://{host}:{port}{server.path}"
+
+    assert requests.post(url, json=update_json(0, -1), timeout=5).status_code == 403
+
+    latencies = []
+    statuses: dict[int, int] = {}
+    lock = threading.Lock()
+
+    def client(number: int):
+        session = requests.Session()
+        local = []
+        for update_id in range(number + 1, updates + 1, clients):
+            payload = update_json(update_id, -(10**12) - update_id % groups)
+            while True:
+                started = time.perf_counter()
+                status = session.post(
+                    url, json=payload, headers={SECRET_HEADER: SECRET}, timeout=10
+                ).status_code
+                local.append(time.perf_counter() - started)
+                with lock:
+                    statuses[status] = statuses.get(status, 0) + 1
+                if status != 503:
+                    break
+                # Overloaded: retry later, as Telegram would
+                time.sleep(0.05)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=[n]) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wait_handled(handled, updates)
+    elapsed = time.perf_counter() - started
+    server.stop()
+    bot.stop_bot()
+
+    print(
+        f"webhook  | {len(handled)}/{updates} handled in {elapsed:.2f} s "
+        f"({len(handled) / elapsed:,.0f} updates/s) | POST p50 {percentile(latencies, 0.5) * 1000:.2f} ms "
+        f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms | statuses {statuses}"
+    )
+
+
+def run_polling(updates: int, groups: int, workers: int, work_ms: float, latency: float):
+    bot, handled = make_bot(workers, work_ms)
+    with FakeTelegram(latency=latency) as fake:
+        telebot.apihelper.API_URL = fake.api_url
+        fake.push(
+            [
+                update_json(update_id, -(10**12) - update_id % groups)
+                for update_id in range(1, updates + 1)
+            ]
+        )
+        started = time.perf_counter()
+        while len(handled) < updates and bot.last_update_id < updates:
+            bot.process_new_updates(
+                bot.get_updates(
+                    offset=bot.last_update_id + 1, limit=100, timeout=5, long_polling_timeout=1
+                )
+            )
+        wait_handled(handled, updates)
+        elapsed = time.perf_counter() - started
+        telebot.apihelper.API_URL = None
+    bot.stop_bot()
+
+    print(
+        f"polling  | {len(handled)}/{updates} handled in {elapsed:.2f} s "
+        f"({len(handled) / elapsed:,.0f} updates/s) | getUpdates calls {fake.requests.get('getUpdates', 0)}"
+    )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--mode", choices=("webhook", "polling", "both"), default="both")
+    argparser.add_argument("--updates", type=int, default=20000)
+    argparser.add_argument("--groups", type=int, default=200)
+    argparser.add_argument("--clients", type=int, default=16)
+    argparser.add_argument("--workers", type=int, default=16)
+    argparser.add_argument("--work-ms", type=float, default=1.0)
+    argparser.add_argument("--max-pending", type=int, default=1000)
+    # Round trip to the real Bot API for each getUpdates call
+    argparser.add_argument("--api-latency", type=float, default=0.05)
+    args = argparser.parse_args()
+
+    if args.mode in ("webhook", "both"):
+        run_webhook(
+            args.updates, args.groups, args.clients, args.workers, args.work_ms, args.max_pending
+        )
+    if args.mode in ("polling", "both"):
+        run_polling(args.updates, args.groups, args.workers, args.work_ms, args.api_latency)
@@ -1,8 +1,14 @@
 from configparser import ConfigParser
+from contextlib import contextmanager
 import logging
+import threading
+import time
 from models.embeddings import Embeddings
-from models.kandinsky import KandinskyClient
+from models.profiles import SimilarityProfiles
+from models.kandinsky_async import AsyncKandinskyClient
 from models.dalle import OpenaiClient
+from models.router import ProviderRouter
+from models.transport import default_recorder
 
 import telebot
 import re
@@ -11,9 +17,25 @@ from telebot.types import (
     InlineKeyboardMarkup,
     Message,
 )
-from queue_bot import start_thread, add_request_to_queue, get_queue_length
-from tinydb import TinyDB, Query
+from queue_bot import (
+    start_thread,
+    add_request_to_queue,
+    estimate_next,
+    record_pick,
+    PreWarmer,
+    QueueNotifier,
+)
+from rate_limit import TokenBucket
+from name_cache import NameCache
+from dispatcher import ChatDispatcher, DispatchingTeleBot
+from outbox import Outbox, HIGH
+from broadcast import Broadcaster
+from capture import UpdateRecorder
+from webhook import WebhookServer
+from metrics import MetricsServer, registry
 from database.database import PostgreClient
+from database.games import GamesStore
+from database.image_cache import ImageCache
 
 gods = [1038099964, 1030055969]
 
@@ -22,62 +44,280 @@ logging.basicConfig(filename="logs.log", format="%(asctime)s %(message)s", filem
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize the ConfigParser
-parser = ConfigParser()
-parser.read("configs.ini")
+HANDLER_LATENCY = registry.histogram(
+    "bot_handler_seconds", "Time spent in a bot handler", ("handler",)
+)
+EMBEDDING_LOOKUP = registry.histogram(
+    "embedding_lookup_seconds", "Time of an embedding lookup", ("op",)
+)
+GENERATION_LATENCY = registry.histogram(
+    "provider_generation_seconds", "Image generation time per provider", ("provider",)
+)
+GENERATIONS = registry.counter(
+    "provider_generations_total", "Image generations per provider and status", ("provider", "status")
+)
+PROVIDER_HTTP = registry.histogram(
+    "provider_http_seconds", "Latency of provider HTTP requests", ("request",)
+)
+PROVIDER_RESPONSES = registry.counter(
+    "provider_http_responses_total", "Provider HTTP responses by status", ("request", "status")
+)
 
-# Get values from the config file
-testing = True
 
-token = parser["DEFAULTS"].get("TOKEN")
-test_token = parser["DEFAULTS"].get("TEST_TOKEN")
+@contextmanager
+def timed_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info(
+            f"Startup phase {name}: {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
 
-delay = int(parser["DEFAULTS"].get("delay")) if not testing else 10
 
-test_bot_name = parser["DEFAULTS"].get("test_bot_name")
-bot_name = parser["DEFAULTS"].get("bot_name") if not testing else test_bot_name
+boot_started = time.perf_counter()
+
+with timed_phase("config"):
+    # Initialize the ConfigParser
+    parser = ConfigParser()
+    parser.read("configs.ini")
+
+    # Get values from the config file
+    testing = True
+
+    token = parser["DEFAULTS"].get("TOKEN")
+    test_token = parser["DEFAULTS"].get("TEST_TOKEN")
+    # Another Bot API server, e.g. a local one; telebot's default otherwise
+    api_url = parser["DEFAULTS"].get("api_url")
+
+    # Expected seconds per generation until real ones have been measured
+    delay = int(parser["DEFAULTS"].get("delay")) if not testing else 10
+    workers = int(parser["DEFAULTS"].get("workers", "4"))
+    max_hints = int(parser["DEFAULTS"].get("max_hints", "10"))
+    neighbour_index = parser["DEFAULTS"].get("neighbour_index", "exact")
+    profile_budget_mb = int(parser["DEFAULTS"].get("profile_budget_mb", "256"))
+    name_ttl = float(parser["DEFAULTS"].get("name_ttl", "86400"))
+    # Queue position edits: how often, and at most how many per round
+    queue_edit_interval = float(parser["DEFAULTS"].get("queue_edit_interval", "5"))
+    queue_edit_batch = int(parser["DEFAULTS"].get("queue_edit_batch", "20"))
+    # Threads handling updates; one chat's updates always go to the same one
+    update_workers = int(parser["DEFAULTS"].get("update_workers", "16"))
+    senders = int(parser["DEFAULTS"].get("senders", "4"))
+    send_rate = float(parser["DEFAULTS"].get("send_rate", "30"))
+    group_rpm = float(parser["DEFAULTS"].get("group_rpm", "20"))
+    private_rate = float(parser["DEFAULTS"].get("private_rate", "1"))
+    # Extra seconds to collect guess results into one message; results for a
+    # rate-limited group are merged anyway
+    digest_window = float(parser["DEFAULTS"].get("digest_window", "0"))
+    # Prometheus endpoint on localhost, off by default; each bot process on a
+    # host needs its own port (9100 is node_exporter's)
+    metrics_port = int(parser["DEFAULTS"].get("metrics_port", "0"))
+    # float32, float16 or int8; None keeps whatever the converted store holds
+    embeddings_dtype = parser["DEFAULTS"].get("embeddings_dtype")
+    embeddings_path = parser["DEFAULTS"].get(
+        "embeddings_path", "models/data/glove.6B.50d"
+    )
+
+    test_bot_name = parser["DEFAULTS"].get("test_bot_name")
+    bot_name = parser["DEFAULTS"].get("bot_name") if not testing else test_bot_name
+
+    kandinsky_api_key = parser["IMAGEGEN"].get("kandisky_api_key")
+    kandinsky_secret_key = parser["IMAGEGEN"].get("kandinsky_secret_key")
+    dalle_api_key = parser["IMAGEGEN"].get("dalle_api_key")
+    kandinsky_url = parser["IMAGEGEN"].get("kandinsky_url", "https://api-key.fusionbrain.ai/")
+    kandinsky_rpm = float(parser["IMAGEGEN"].get("kandinsky_rpm", "6"))
+    reuse_images = parser["IMAGEGEN"].getboolean("reuse_images", True)
+    image_cache_mb = int(parser["IMAGEGEN"].get("image_cache_mb", "512"))
+    image_cache_days = float(parser["IMAGEGEN"].get("image_cache_days", "30"))
+    pregen_stock = int(parser["IMAGEGEN"].get("pregen_stock", "50"))
+    pregen_interval = float(parser["IMAGEGEN"].get("pregen_interval", "30"))
+    dalle_rpm = float(parser["IMAGEGEN"].get("dalle_rpm", "5"))
+    # OpenAI-compatible endpoint; the SDK's default otherwise
+    dalle_url = parser["IMAGEGEN"].get("dalle_url")
+    # Image providers in order of preference; DALL·E only with a key
+    providers = parser["IMAGEGEN"].get(
+        "providers", "kandinsky, dalle" if dalle_api_key else "kandinsky"
+    )
+    providers = [name.strip() for name in providers.split(",") if name.strip()]
+    # A second provider is raced once a request is slower than this quantile
+    hedge_quantile = float(parser["IMAGEGEN"].get("hedge_quantile", "0.95"))
+    provider_failures = int(parser["IMAGEGEN"].get("provider_failures", "3"))
+    provider_cooldown = float(parser["IMAGEGEN"].get("provider_cooldown", "60"))
+
+    host = parser["DATABASE"].get("host")
+    username = parser["DATABASE"].get("username")
+    password = parser["DATABASE"].get("password")
+
+    user_db_name = parser["DATABASE"].get("user_db_name")
+    games_db_name = parser["DATABASE"].get("games_db_name")
+
+    # Public HTTPS address Telegram posts updates to; without it the bot polls
+    webhook_url = parser.get("WEBHOOK", "url", fallback=None)
+    webhook_host = parser.get("WEBHOOK", "host", fallback="0.0.0.0")
+    webhook_port = parser.getint("WEBHOOK", "port", fallback=8443)
+    webhook_path = parser.get("WEBHOOK", "path", fallback="/webhook")
+    webhook_secret = parser.get("WEBHOOK", "secret", fallback=None)
+    webhook_max_pending = parser.getint("WEBHOOK", "max_pending", fallback=1000)
+    webhook_cert = parser.get("WEBHOOK", "certfile", fallback=None)
+    webhook_key = parser.get("WEBHOOK", "keyfile", fallback=None)
+
+    # Anonymised recording of incoming updates for load tests, off by default
+    capture_path = parser.get("CAPTURE", "path", fallback=None)
+    capture_salt = parser.get("CAPTURE", "salt", fallback=None)
+
+# Initialize the telebot and OpenaiClient
+if api_url:
+    telebot.apihelper.API_URL = api_url
+bot = DispatchingTeleBot(
+    test_token if testing else token,
+    ChatDispatcher(workers=update_workers, logger=logger).start(),
+    recorder=(
+        UpdateRecorder(capture_path, salt=capture_salt, logger=logger)
+        if capture_path
+        else None
+    ),
+)
+name_cache = NameCache(ttl=name_ttl)
+outbox = Outbox(
+    bot,
+    senders=senders,
+    global_rate=send_rate,
+    private_rate=private_rate,
+    group_rpm=group_rpm,
+    digest_window=digest_window,
+    logger=logger,
+).start()
+kandinsky_rate_limit = TokenBucket.per_minute(kandinsky_rpm)
+kandinsky_client = AsyncKandinskyClient(
+    kandinsky_url,
+    kandinsky_api_key,
+    kandinsky_secret_key,
+    rate_limit=kandinsky_rate_limit,
+)
 
-kandinsky_api_key = parser["IMAGEGEN"].get("kandisky_api_key")
-kandinsky_secret_key = parser["IMAGEGEN"].get("kandinsky_secret_key")
-dalle_api_key = parser["IMAGEGEN"].get("dalle_api_key")
 
-host = parser["DATABASE"].get("host")
-username = parser["DATABASE"].get("username")
-password = parser["DATABASE"].get("password")
+def record_provider_request(name: str, seconds: float, status):
+    PROVIDER_HTTP.observe(seconds, request=name)
+    PROVIDER_RESPONSES.inc(request=name, status=status)
 
-user_db_name = parser["DATABASE"].get("user_db_name")
-games_db_name = parser["DATABASE"].get("games_db_name")
 
-# Initialize the telebot and OpenaiClient
-bot = telebot.TeleBot(test_token if testing else token)
-dalle_client = OpenaiClient(dalle_api_key)
-kandinsky_client = KandinskyClient(
-    "https://api-key.fusionbrain.ai/", kandinsky_api_key, kandinsky_secret_key
+default_recorder.listeners.append(record_provider_request)
+
+
+def measured_generation(provider: str, generate):
+    def inner(prompt: str) -> tuple:
+        with GENERATION_LATENCY.time(provider=provider):
+            status, data = generate(prompt)
+        GENERATIONS.inc(provider=provider, status=status)
+        return status, data
+
+    return inner
+
+
+# Cache namespace from when Kandinsky was the only provider, kept so that
+# cached images stay valid; any provider's image of a word will do
+IMAGE_CACHE_KEY = "kandinsky"
+image_router = ProviderRouter(
+    hedge_quantile=hedge_quantile,
+    failure_threshold=provider_failures,
+    cooldown=provider_cooldown,
+    logger=logger,
+)
+provider_clients = {"kandinsky": (kandinsky_client, kandinsky_rate_limit)}
+if "dalle" in providers:
+    # The SDK refuses to start without a key, so only when it is used
+    dalle_rate_limit = TokenBucket.per_minute(dalle_rpm)
+    provider_clients["dalle"] = (
+        OpenaiClient(dalle_api_key, rate_limit=dalle_rate_limit, base_url=dalle_url),
+        dalle_rate_limit,
+    )
+provider_generators = {}
+for provider in providers:
+    client, rate_limit = provider_clients[provider]
+    provider_generators[provider] = measured_generation(provider, client.generate_image)
+    image_router.add(provider, provider_generators[provider], rate_limit=rate_limit)
+# Time to image as players see it, hedges and failovers included
+generate_image = measured_generation("router", image_router.generate_image)
+registry.gauge(
+    "image_router_hedges",
+    "Hedged second requests started",
+    func=lambda: image_router.stats()["hedges"],
+)
+registry.gauge(
+    "image_router_failovers",
+    "Requests moved to another provider after a failure",
+    func=lambda: image_router.stats()["failovers"],
 )
-embedding_client = Embeddings()
-
-# Dictionary to store game data
-games_db = TinyDB("database/games.json")
-User = Query()
-if not testing:
-    database_client = PostgreClient(
-        host=host,
+registry.gauge("outbox_pending", "Bot API calls waiting in the outbox", func=outbox.pending)
+with timed_phase("embeddings"):
+    embedding_client = Embeddings(
+        embeddings_path, neighbour_index=neighbour_index, dtype=embeddings_dtype
+    )
+    # Sorted similarity of each running game's answer to the whole vocabulary
+    profiles = SimilarityProfiles(
+        embedding_client, budget_bytes=profile_budget_mb * 1024 * 1024
+    )
+
+with timed_phase("db connect"):
+    # Game state keyed by chat id
+    games_db = GamesStore("database/games.db", logger=logger)
+    image_cache = ImageCache(
+        "database/images.db",
+        max_bytes=image_cache_mb * 1024 * 1024,
+        max_age=image_cache_days * 24 * 3600,
         logger=logger,
-        password=password,
-        dbname=user_db_name,
-        user=username,
     )
-    database_client.init_user_table()
+    # Progress of restart/resume notices, so a crash does not resend them
+    broadcaster = Broadcaster(outbox, "database/broadcasts.db", logger=logger)
+    if not testing:
+        database_client = PostgreClient(
+            host=host,
+            logger=logger,
+            password=password,
+            dbname=user_db_name,
+            user=username,
+        )
+        database_client.init_user_table()
+
+
+def resume_broadcast():
+    with timed_phase("resume broadcast"):
+        # Restart notices cut short by a crash are stale by now
+        broadcaster.abandon("restart")
+        jobs = broadcaster.unfinished("resume") or [
+            broadcaster.create(
+                "resume",
+                "✨ *Спасибо за ожидание*. Вы можете продолжать играть",
+                games_db.ids(),
+                parse_mode="Markdown",
+            )
+        ]
+        for job_id in jobs:
+            broadcaster.run(job_id)
 
-for game in games_db.all():
-    game = game["id"]
-    bot.send_message(
-        int(game),
-        "✨ *Спасибо за ожидание*. Вы можете продолжать играть",
-        parse_mode="Markdown",
+
+def format_queue_message(position: int, seconds: float) -> str:
+    # Coarse steps, so the text (and the message) only changes when it matters
+    if seconds >= 90:
+        wait = f"*{round(seconds / 60)}* мин."
+    else:
+        wait = f"*{max(10, round(seconds / 10) * 10)}* сек."
+    return (
+        "⌛ Вы добавлены в очередь.\n"
+        f"Место в очереди: *{position}*\n"
+        f"Примерное время ожидания: {wait}"
     )
 
 
+queue_notifier = QueueNotifier(
+    outbox,
+    format_queue_message,
+    interval=queue_edit_interval,
+    max_edits=queue_edit_batch,
+    logger=logger,
+)
+
+
 def contains_only_english_letters(word):
     return bool(re.match("^[a-zA-Z]+$", word))
 
@@ -100,7 +340,7 @@ def start(message: Message):
             if message.chat.type == "private" and not testing:
                 database_client.add_user_if_not_exists(message.from_user.id)
 
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 "👋 Привет! Я - бот, с помощью которого можно загадывать слова, чтобы твои друзья их отгадывали. Я буду давать им подсказки и указывать, насколько они близки к правильному слову. Чтобы загадать слово, напиши в группе /play. (Играть надо на английском языке)",
             )
@@ -115,34 +355,34 @@ def start(message: Message):
                     group_id = param[4:]
                     if group_id.startswith("-"):
                         # Check if a game is already in progress for the group ID
-                        if games_db.search(User.id == str(group_id)):
-                            bot.send_message(
+                        if games_db.exists(group_id):
+                            outbox.send_message(
                                 message.chat.id, "❌ Игра уже идет или вы уже в очереди!"
                             )
                         else:
                             # Prompt the user to send a word to be guessed
-                            answer_message = bot.send_message(
+                            answer_message = outbox.send_message(
                                 message.chat.id,
                                 "Отправь мне слово, которое хочешь загадать! 😨",
-                            )
+                            ).result()
                             # Register a handler for the next message to start word picking
                             bot.register_next_step_handler(
                                 answer_message, start_word_picking, int(group_id)
                             )
                     else:
-                        bot.send_message(
+                        outbox.send_message(
                             message.chat.id,
                             "❌ Не пытайся запустить игру в личных сообщениях!",
                         )
             else:
                 # Send an error message if the command with parameter is used in a group chat
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     "❌ Команду с параметром можно использовать только в личных сообщениях!",
                 )
     except Exception as e:
         # Send an error message if an exception occurs
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"⛔ Возникла ошибка, пожалуйста, сообщите об этом @FoxFil\n\nОшибка:\n\n`{e}`",
             parse_mode="Markdown",
@@ -156,9 +396,9 @@ def play(message: Message):
         # Check if the message is in a private chat
         if not message.chat.type == "private":
             # Check if a game is already in progress for the chat
-            if not games_db.search(User.id == str(message.chat.id)):
+            if not games_db.exists(message.chat.id):
                 # Send a message with a button to start the game
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     "Чтобы загадать слово, нажми на кнопку ниже! 😁",
                     reply_markup=InlineKeyboardMarkup(
@@ -174,20 +414,20 @@ def play(message: Message):
                 )
             else:
                 # Send a message indicating that a game is already in progress
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     f"❌ Игра уже идет или вы уже в очереди!",
                     parse_mode="Markdown",
                 )
         else:
             # Send a message indicating that the command can only be used in a group chat
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 "❌ Эту команду можно использовать только в групповом чате!",
             )
     except Exception as e:
         # Send a message indicating that an error occurred
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"⛔ Возникла ошибка, пожалуйста, сообщите об этом @FoxFil\n\nОшибка:\n\n`{e}`",
             parse_mode="Markdown",
@@ -195,66 +435,78 @@ def play(message: Message):
         logger.error(f"ERROR: {e}")
 
 
-def from_queue_processing(request: tuple):
+@HANDLER_LATENCY.timed(handler="from_queue_processing")
+def from_queue_processing(request: tuple, cached: tuple | None = None):
+    """``cached`` is an ``image_cache.get`` entry to start from instead of generating."""
     answer, group_id, dms_id, user_nick, message_queue_id, user_id = request
 
-    bot.delete_message(dms_id, message_queue_id)
+    if message_queue_id is not None:
+        outbox.delete_message(dms_id, message_queue_id)
 
-    games_db.upsert(
-        {"id": str(group_id), "data": [answer, {}, "", {}, ""]},
-        User.id == str(group_id),
-    )
+    games_db.upsert(group_id, [answer, {}, "", {}, "", 0])
 
-    image_generation = bot.send_message(
+    image_generation = outbox.send_message(
         dms_id,
         f'Картинка "*{answer}*" генерируется 😎',
         parse_mode="Markdown",
-    )
-    status, generated_photo_bytes = kandinsky_client.generate_image(answer)
+    ).result()
+    if cached is not None:
+        status, (generated_photo_bytes, cached_file_id) = 200, cached
+    else:
+        status, generated_photo_bytes, cached_file_id = image_cache.get_or_generate(
+            IMAGE_CACHE_KEY, answer, generate_image, reuse=reuse_images
+        )
 
     if status == 200:
-        sent_image = bot.send_photo(
-            group_id,
-            generated_photo_bytes,
-            f"Пользователь *{user_nick}* загадал слово!\nПишите свои ответы в формате `/guess ответ`,  `guess ответ` или просто отвечай на сообщения бота в этом чате!\nЧтобы остановить игру, напиши `/stop`.",
-            parse_mode="Markdown",
-        )
-        bot.delete_message(dms_id, image_generation.message_id)
+        caption = f"Пользователь *{user_nick}* загадал слово!\nПишите свои ответы в формате `/guess ответ`,  `guess ответ` или просто отвечай на сообщения бота в этом чате!\nЧтобы остановить игру, напиши `/stop`."
+        sent_image = None
+        if cached_file_id:
+            try:
+                sent_image = outbox.send_photo(
+                    group_id, cached_file_id, caption, priority=HIGH, parse_mode="Markdown"
+                ).result()
+            except telebot.apihelper.ApiTelegramException as e:
+                logger.error(f"ERROR: cached file_id rejected: {e}")
+        if sent_image is None:
+            sent_image = outbox.send_photo(
+                group_id, generated_photo_bytes, caption, priority=HIGH, parse_mode="Markdown"
+            ).result()
+            image_cache.set_file_id(IMAGE_CACHE_KEY, answer, sent_image.photo[-1].file_id)
+        outbox.delete_message(dms_id, image_generation.message_id)
 
         games_db.upsert(
-            {
-                "id": str(group_id),
-                "data": [answer, {}, sent_image.photo[0].file_id, {}, user_id],
-            },
-            User.id == str(group_id),
+            group_id, [answer, {}, sent_image.photo[0].file_id, {}, user_id, 0]
         )
 
-        bot.send_message(
+        outbox.send_message(
             dms_id,
             f'Ваше слово "*{answer}*" успешно загадано! ✅ Перейдите обратно в группу.',
             parse_mode="Markdown",
         )
 
+        profiles.build(group_id, answer)
+
     else:
-        games_db.remove(doc_ids=[games_db.search(User.id == str(group_id))[0].doc_id])
-        bot.delete_message(dms_id, image_generation.message_id)
-        bot.send_message(
+        games_db.remove(group_id)
+        outbox.delete_message(dms_id, image_generation.message_id)
+        outbox.send_message(
             dms_id,
             f"❌ Ошибка генерации. Возможно, ваш запрос содержит недопустимые слова.",
             parse_mode="Markdown",
         )
-        bot.send_message(
+        outbox.send_message(
             group_id,
             f"❌ Ошибка генерации. Начните игру заново.",
             parse_mode="Markdown",
         )
 
 
+@HANDLER_LATENCY.timed(handler="start_word_picking")
 def start_word_picking(message: Message, group_id: int):
     try:
         # Check if a game is already in progress
-        if games_db.search(User.id == str(group_id)):
-            bot.send_message(message.chat.id, "❌ Игра уже идет или вы уже в очереди!")
+        if games_db.exists(group_id):
+            outbox.send_message(message.chat.id, "❌ Игра уже идет или вы уже в очереди!")
         else:
             answer = message.text.strip().lower()
             # Check if the answer is a single word
@@ -266,27 +518,43 @@ def start_word_picking(message: Message, group_id: int):
                     if embedding_client.exist(answer_embedding):
                         logging.info(f"Game started | ans: {answer} | g_id: {group_id}")
 
-                        lenght = get_queue_length() + 1
+                        if not games_db.insert_if_absent(
+                            group_id, [answer, {}, "", {}, "", 0]
+                        ):
+                            outbox.send_message(
+                                message.chat.id, "❌ Игра уже идет или вы уже в очереди!"
+                            )
+                            return
 
-                        games_db.upsert(
-                            {"id": str(group_id), "data": [answer, {}, "", {}, ""]},
-                            User.id == str(group_id),
+                        # Pre-generated image: start right away, skipping the queue.
+                        # Only from this entry; generating here would stall the
+                        # update worker, so a vanished entry goes to the queue
+                        cached = image_cache.get(
+                            IMAGE_CACHE_KEY, answer, unsent_only=not reuse_images
                         )
+                        if cached is not None:
+                            record_pick(answer)
+                            from_queue_processing(
+                                (
+                                    answer,
+                                    group_id,
+                                    message.chat.id,
+                                    message.from_user.full_name,
+                                    None,
+                                    message.from_user.id,
+                                ),
+                                cached=cached,
+                            )
+                            return
 
-                        wait_time = lenght * delay
-
-                        queue_message = bot.send_message(
+                        queue_text = format_queue_message(*estimate_next())
+                        queue_message = outbox.send_message(
                             message.chat.id,
-                            "⌛ Вы добавлены в очередь.\nПримерное время ожидания: "
-                            + (
-                                f"*{wait_time // 60}* мин."
-                                if (wait_time // 60) > 0
-                                else f"*{wait_time}* сек."
-                            ),
+                            queue_text,
                             parse_mode="Markdown",
-                        )
+                        ).result()
 
-                        add_request_to_queue(
+                        item_id = add_request_to_queue(
                             answer,
                             group_id,
                             message.chat.id,
@@ -295,9 +563,10 @@ def start_word_picking(message: Message, group_id: int):
                             message.from_user.id,
                             logger,
                         )
+                        queue_notifier.shown(item_id, queue_text)
 
                     else:
-                        bot.send_message(
+                        outbox.send_message(
                             message.chat.id,
                             "❌ Такого слова не существует!",
                             reply_markup=InlineKeyboardMarkup(
@@ -312,7 +581,7 @@ def start_word_picking(message: Message, group_id: int):
                             ),
                         )
                 else:
-                    bot.send_message(
+                    outbox.send_message(
                         message.chat.id,
                         "❌ Слово должно быть английским и состоять только из букв!",
                         reply_markup=InlineKeyboardMarkup(
@@ -327,7 +596,7 @@ def start_word_picking(message: Message, group_id: int):
                         ),
                     )
             else:
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     "❌ Пришли мне слово, а не предложение!",
                     reply_markup=InlineKeyboardMarkup(
@@ -342,7 +611,7 @@ def start_word_picking(message: Message, group_id: int):
                     ),
                 )
     except Exception as e:
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"⛔ Возникла ошибка, пожалуйста, сообщите об этом @FoxFil\n\nОшибка:\n\n`{e}`",
             parse_mode="Markdown",
@@ -351,182 +620,114 @@ def start_word_picking(message: Message, group_id: int):
 
 
 @bot.message_handler(commands=["guess"])
+@HANDLER_LATENCY.timed(handler="guess")
 def guess(message: Message):
     try:
         group_id = message.chat.id
+        game = games_db.get(group_id)
+        name_cache.remember(group_id, message.from_user)
 
-        if not games_db.search(User.id == str(group_id)):
-            bot.send_message(message.chat.id, "❌ Сейчас не идет никакая игра!")
+        if game is None:
+            outbox.send_message(message.chat.id, "❌ Сейчас не идет никакая игра!")
         else:
             if not message.chat.type == "private":
                 param = get_parameter(message.text)
                 if param:
-                    if games_db.search(User.id == str(group_id))[0]["data"][2] != "":
+                    if game[2] != "":
                         if contains_only_english_letters(param):
                             given_try = param.lower().strip()
-                            correct_answer = (
-                                games_db.search(User.id == str(group_id))[0]["data"][0]
-                                .lower()
-                                .strip()
-                            )
+                            correct_answer = game[0].lower().strip()
                             if correct_answer == given_try:
-                                if games_db.search(User.id == str(group_id)):
-                                    new_dict = games_db.search(
-                                        User.id == str(group_id)
-                                    )[0]["data"][3]
-
-                                    new_dict[str(message.from_user.id)] = new_dict.get(
-                                        str(message.from_user.id), []
-                                    ) + [100]
-
-                                    games_db.upsert(
-                                        {
-                                            "id": str(group_id),
-                                            "data": [
-                                                correct_answer,
-                                                games_db.search(
-                                                    User.id == str(group_id)
-                                                )[0]["data"][1],
-                                                games_db.search(
-                                                    User.id == str(group_id)
-                                                )[0]["data"][2],
-                                                new_dict,
-                                                games_db.search(
-                                                    User.id == str(group_id)
-                                                )[0]["data"][4],
-                                            ],
-                                        },
-                                        User.id == str(group_id),
-                                    )
+                                game = games_db.add_guess(
+                                    group_id, message.from_user.id, 100
+                                )
+                                if game is not None:
                                     top_final("10", message.chat.id)
                                     scoreboard_final(message.chat.id)
-                                    if (
-                                        len(
-                                            games_db.search(User.id == str(group_id))[
-                                                0
-                                            ]["data"][3][str(message.from_user.id)]
-                                        )
-                                        == 1
-                                    ):
-                                        bot.send_message(
+                                    if game[3][str(message.from_user.id)][0] == 1:
+                                        outbox.send_message(
                                             group_id,
                                             f"🎉 *{message.from_user.full_name}*, молодец! Ты отгадал слово *{correct_answer}* с первой попытки! Вот это мастерство! 🤯",
+                                            priority=HIGH,
                                             parse_mode="Markdown",
                                         )
                                     else:
-                                        bot.send_message(
+                                        outbox.send_message(
                                             group_id,
                                             f"🎉 *{message.from_user.full_name}* отгадал слово *{correct_answer}*! Игра заканчивается.",
+                                            priority=HIGH,
                                             parse_mode="Markdown",
                                         )
-                                    if games_db.search(User.id == str(group_id)):
-                                        games_db.remove(
-                                            doc_ids=[
-                                                games_db.search(
-                                                    User.id == str(group_id)
-                                                )[0].doc_id
-                                            ]
-                                        )
+                                    games_db.remove(group_id)
+                                    profiles.release(group_id)
 
                                     logger.info(f"Game ended | g_id: {group_id}")
                                 else:
-                                    bot.send_message(
+                                    outbox.send_message(
                                         message.chat.id,
                                         "❌ Сейчас не идет никакая игра!",
                                     )
                             else:
-                                correct_embedding = embedding_client.get_embedding(
-                                    correct_answer
-                                )
-                                given_try_embedding = embedding_client.get_embedding(
-                                    given_try
-                                )
+                                with EMBEDDING_LOOKUP.time(op="similarity"):
+                                    div = embedding_client.similarity(
+                                        correct_answer, given_try
+                                    )
 
                                 logger.info(
                                     f"Get {given_try} from {message.from_user.id} | {group_id}"
                                 )
 
-                                if embedding_client.exist(given_try_embedding):
-                                    div = embedding_client.cosine_similarity(
-                                        correct_embedding, given_try_embedding
-                                    )
-                                    bot.send_message(
+                                if div is not None:
+                                    with EMBEDDING_LOOKUP.time(op="rank"):
+                                        rank = profiles.rank(
+                                            group_id, correct_answer, given_try
+                                        )
+                                    outbox.send_digest(
                                         group_id,
-                                        f"*{message.from_user.full_name}* близок к правильному ответу на *{round(div * 100, 2)}%*",
+                                        f"*{message.from_user.full_name}* близок к правильному ответу на *{round(div * 100, 2)}%*"
+                                        + (f" (#{rank} по близости)" if rank else ""),
                                         parse_mode="Markdown",
                                     )
-                                    if games_db.search(User.id == str(group_id)):
-                                        new_dict1 = games_db.search(
-                                            User.id == str(group_id)
-                                        )[0]["data"][1]
-
-                                        new_dict1[given_try] = f"{round(div * 100, 2)}%"
-
-                                        new_dict2 = games_db.search(
-                                            User.id == str(group_id)
-                                        )[0]["data"][3]
-
-                                        new_dict2[
-                                            str(message.from_user.id)
-                                        ] = new_dict2.get(
-                                            str(message.from_user.id), []
-                                        ) + [
-                                            round(div * 100, 2)
-                                        ]
-
-                                        games_db.upsert(
-                                            {
-                                                "id": str(group_id),
-                                                "data": [
-                                                    games_db.search(
-                                                        User.id == str(group_id)
-                                                    )[0]["data"][0],
-                                                    new_dict1,
-                                                    games_db.search(
-                                                        User.id == str(group_id)
-                                                    )[0]["data"][2],
-                                                    new_dict2,
-                                                    games_db.search(
-                                                        User.id == str(group_id)
-                                                    )[0]["data"][4],
-                                                ],
-                                            },
-                                            User.id == str(group_id),
-                                        )
+                                    games_db.add_guess(
+                                        group_id,
+                                        message.from_user.id,
+                                        round(div * 100, 2),
+                                        given_try,
+                                    )
 
                                 else:
-                                    bot.send_message(
+                                    outbox.send_message(
                                         message.chat.id,
                                         f"❌ *{message.from_user.full_name}*, такого слова не существует!",
                                         parse_mode="Markdown",
                                     )
 
                         else:
-                            bot.send_message(
+                            outbox.send_message(
                                 message.chat.id,
                                 f"❌ *{message.from_user.full_name}*, отгадка должна быть на английском языке и состоять только из букв!",
                                 parse_mode="Markdown",
                             )
                     else:
-                        bot.send_message(
+                        outbox.send_message(
                             message.chat.id,
                             f"❌ *{message.from_user.full_name}*, не спеши! Картинка еще генерируется, или вы в очереди.",
                             parse_mode="Markdown",
                         )
                 else:
-                    bot.send_message(
+                    outbox.send_message(
                         message.chat.id,
                         f"❌ *{message.from_user.full_name}*, отгадка должна быть одним словом!",
                         parse_mode="Markdown",
                     )
             else:
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     "❌ Эту команду можно использовать только в групповом чате!",
                 )
     except Exception as e:
         logger.error(f"ERROR: {e}")
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"⛔ Возникла ошибка, пожалуйста, сообщите об этом @FoxFil\n\nОшибка:\n\n`{e}`",
             parse_mode="Markdown",
@@ -534,71 +735,55 @@ def guess(message: Message):
 
 
 @bot.message_handler(commands=["top"])
+@HANDLER_LATENCY.timed(handler="top")
 def top(message: Message):
     try:
-        if games_db.search(User.id == str(message.chat.id)):
+        game = games_db.get(message.chat.id)
+        if game is not None:
             param = get_parameter(message.text)
             if not param:
                 param = "5"
             if param.isdigit():
                 count = int(param)
                 if 1 <= count <= 100:
-                    prep_val = games_db.search(User.id == str(message.chat.id))[0][
-                        "data"
-                    ][1]
-                    if len(prep_val.keys()) != 0:
-                        sorted_words = list(
-                            sorted(
-                                list(prep_val.items()),
-                                key=lambda x: float(x[1][:-1]),
-                                reverse=True,
-                            )
-                        )
-
-                        count = (
-                            len(sorted_words) if len(sorted_words) < count else count
-                        )
-
-                        top = sorted_words[:count]
-
+                    top = games_db.top(message.chat.id, count)
+                    if len(top) != 0:
                         output = ""
                         for i, (word, percentage) in enumerate(top, start=1):
-                            output += f"{i}) *{word}*: {percentage}\n"
+                            output += f"{i}) *{word}*: {percentage}%\n"
 
-                        bot.send_message(message.chat.id, output, parse_mode="Markdown")
-                        bot.send_photo(
+                        outbox.send_message(message.chat.id, output, parse_mode="Markdown")
+                        outbox.send_photo(
                             message.chat.id,
-                            photo=games_db.search(User.id == str(message.chat.id))[0][
-                                "data"
-                            ][2],
+                            photo=game[2],
                         )
                     else:
-                        bot.send_message(
+                        outbox.send_message(
                             message.chat.id,
                             f"❌ *{message.from_user.full_name}*, никаких отгадок еще нет!",
                             parse_mode="Markdown",
                         )
 
                 else:
-                    bot.send_message(
+                    outbox.send_message(
                         message.chat.id,
                         f"❌ *{message.from_user.full_name}*, укажите количество слов для вывода от 1 до 100.",
                         parse_mode="Markdown",
                     )
             else:
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     f"❌ *{message.from_user.full_name}*, параметр должен быть числом (от 1 до 100)!",
                     parse_mode="Markdown",
                 )
         else:
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 f"❌ *{message.from_user.full_name}*, игра в данный момент не идет",
                 parse_mode="Markdown",
             )
     except Exception as e:
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"⛔️ Возникла ошибка, пожалуйста, сообщите об этом @FoxFil\n\nОшибка:\n\n`{e}`",
             parse_mode="Markdown",
@@ -607,36 +792,27 @@ def top(message: Message):
 
 
 def top_final(amount: str, id: int):
-    prep_val = games_db.search(User.id == str(id))[0]["data"][1]
-
-    if len(prep_val.keys()) != 0:
-        count = int(amount)
-
-        sorted_words = list(
-            sorted(list(prep_val.items()), key=lambda x: float(x[1][:-1]), reverse=True)
-        )
-
-        count = len(sorted_words) if len(sorted_words) < count else count
-
-        top = sorted_words[:count]
+    top = games_db.top(id, int(amount))
 
+    if len(top) != 0:
         output = "Статистика по словам:\n\n"
         for i, (word, percentage) in enumerate(top, start=1):
-            output += f"{i}) *{word}*: {percentage}\n"
+            output += f"{i}) *{word}*: {percentage}%\n"
 
-        bot.send_message(id, output, parse_mode="Markdown")
+        outbox.send_message(id, output, priority=HIGH, parse_mode="Markdown")
 
 
 def scoreboard_final(group_id: int):
-    players = games_db.search(User.id == str(group_id))[0]["data"][3]
+    players = games_db.get(group_id)[3]
 
     output_list = []
     for elem in players.items():
         output_list.append(
             [
-                bot.get_chat_member(group_id, str(elem[0])).user.first_name,
-                len(elem[1]),
-                sum(elem[1]) / len(elem[1]),
+                # Filled by guess(), so this only calls Telegram for stale names
+                name_cache.get_or_fetch(bot, group_id, elem[0]),
+                elem[1][0],
+                elem[1][1] / elem[1][0],
             ]
         )
 
@@ -644,71 +820,114 @@ def scoreboard_final(group_id: int):
 
     result = "Статистика по пользователям (количество угадываний, средний показатель совпадения):\n\n"
 
-    max_id = max(
-        players.keys(),
-        key=lambda x: (
-            len(bot.get_chat_member(group_id, str(x)).user.first_name)
-            + len(str(players[x][0]))
-        ),
-    )
-
-    max_len = len(bot.get_chat_member(group_id, str(max_id)).user.first_name) + len(
-        str(len(players[str(max_id)]))
-    )
+    max_len = max(len(elem[0]) + len(str(elem[1])) for elem in output_list)
 
     for elem in output_list:
         result += f"`{elem[0]}: {' ' * (max_len - len(elem[0]) - len(str(elem[1])))}{elem[1]} | {round(elem[2])}%`\n"
 
-    bot.send_message(group_id, result, parse_mode="Markdown")
+    outbox.send_message(group_id, result, priority=HIGH, parse_mode="Markdown")
 
 
 @bot.message_handler(commands=["stop"])
 def stop(message: Message):
     try:
         if not message.chat.type == "private":
-            if games_db.search(User.id == str(message.chat.id)):
-                if games_db.search(User.id == str(message.chat.id))[0]["data"][4] != "":
-                    if message.from_user.id == int(
-                        games_db.search(User.id == str(message.chat.id))[0]["data"][4]
-                    ):
-                        games_db.remove(
-                            doc_ids=[
-                                games_db.search(User.id == str(message.chat.id))[
-                                    0
-                                ].doc_id
-                            ]
-                        )
-                        bot.send_message(
+            game = games_db.get(message.chat.id)
+            if game is not None:
+                if game[4] != "":
+                    if message.from_user.id == int(game[4]):
+                        games_db.remove(message.chat.id)
+                        profiles.release(message.chat.id)
+                        outbox.send_message(
                             message.chat.id,
                             f"🛑 Игра остановлена! Её остановил *{message.from_user.full_name}*.",
+                            priority=HIGH,
                             parse_mode="Markdown",
                         )
                     else:
-                        bot.send_message(
+                        outbox.send_message(
                             message.chat.id,
                             f"❌ *{message.from_user.full_name}*, эту команду может использовать только создатель игры!",
                             parse_mode="Markdown",
                         )
                 else:
-                    bot.send_message(
+                    outbox.send_message(
                         message.chat.id,
                         f"❌ *{message.from_user.full_name}*, игра ещё не запустилась. Вы в очереди.",
                         parse_mode="Markdown",
                     )
             else:
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     f"❌ *{message.from_user.full_name}*, игра в данный момент не идет",
                     parse_mode="Markdown",
                 )
         else:
             # Send a message indicating that the command can only be used in a group chat
-            bot.send_message(
+            outbox.send_message(
+                message.chat.id,
+                "❌ Эту команду можно использовать только в групповом чате!",
+            )
+    except Exception as e:
+        outbox.send_message(
+            message.chat.id,
+            f"⛔️ Возникла ошибка, пожалуйста, сообщите об этом @FoxFil\n\nОшибка:\n\n`{e}`",
+            parse_mode="Markdown",
+        )
+        logger.error(f"ERROR: {e}")
+
+
+def take_hint(data: list) -> int:
+    # Games saved before hints existed have no counter yet
+    if len(data) < 6:
+        data.append(0)
+    data[5] += 1
+    return data[5]
+
+
+@bot.message_handler(commands=["hint"])
+def hint(message: Message):
+    try:
+        if not message.chat.type == "private":
+            game = games_db.get(message.chat.id)
+            if game is None:
+                outbox.send_message(
+                    message.chat.id,
+                    f"❌ *{message.from_user.full_name}*, игра в данный момент не идет",
+                    parse_mode="Markdown",
+                )
+            elif game[2] == "":
+                outbox.send_message(
+                    message.chat.id,
+                    f"❌ *{message.from_user.full_name}*, не спеши! Картинка еще генерируется, или вы в очереди.",
+                    parse_mode="Markdown",
+                )
+            else:
+                # Hints go from the furthest of the nearest words to the closest
+                with EMBEDDING_LOOKUP.time(op="nearest"):
+                    hints = embedding_client.nearest(game[0].lower().strip(), max_hints)
+                number = games_db.update(message.chat.id, take_hint)
+                if number is None:
+                    return
+                if number > len(hints):
+                    outbox.send_message(
+                        message.chat.id,
+                        "❌ Подсказки закончились!",
+                    )
+                else:
+                    word, score = hints[len(hints) - number]
+                    outbox.send_message(
+                        message.chat.id,
+                        f"💡 Подсказка {number}/{len(hints)}: *{word}* близко к ответу на *{round(score * 100, 2)}%*",
+                        parse_mode="Markdown",
+                    )
+        else:
+            outbox.send_message(
                 message.chat.id,
                 "❌ Эту команду можно использовать только в групповом чате!",
             )
     except Exception as e:
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"⛔️ Возникла ошибка, пожалуйста, сообщите об этом @FoxFil\n\nОшибка:\n\n`{e}`",
             parse_mode="Markdown",
@@ -719,24 +938,50 @@ def stop(message: Message):
 @bot.message_handler(commands=["shutdown"])
 def shutdown(message: Message):
     if message.from_user.id in gods:
-        restart = bot.send_message(
+        restart = outbox.send_message(
             message.chat.id,
             f"⌛️ Произвожу рестарт...",
+            priority=HIGH,
+        ).result()
+        games = games_db.ids()
+        job_id = broadcaster.create(
+            "restart",
+            "ℹ️ *Внимание!* ℹ️\n\nСейчас произойдёт запланированный рестарт бота. Ваша игра сохранится. Пожалуйста, подождите. Приносим свои извинения за неудобства.",
+            games,
+            parse_mode="Markdown",
         )
-        for game in games_db.all():
-            game = game["id"]
-            bot.send_message(
-                int(game),
-                "ℹ️ *Внимание!* ℹ️\n\nСейчас произойдёт запланированный рестарт бота. Ваша игра сохранится. Пожалуйста, подождите. Приносим свои извинения за неудобства.",
-                parse_mode="Markdown",
+
+        def progress(counts: dict):
+            outbox.edit_message_text(
+                message.chat.id,
+                restart.message_id,
+                f"⌛️ Произвожу рестарт...\nРазослано: {counts.get('sent', 0)}/{len(games)}, ошибок: {counts.get('failed', 0)}",
+                priority=HIGH,
             )
-        bot.delete_message(message.chat.id, restart.message_id)
+
+        counts = broadcaster.run(job_id, progress=progress)
+        outbox.delete_message(message.chat.id, restart.message_id)
         logger.info("shutdowned bot")
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
-            f"✅ Сообщения отправились успешно!",
+            f"✅ Сообщения отправились успешно! Доставлено: {counts.get('sent', 0)}/{len(games)}, ошибок: {counts.get('failed', 0)}",
         )
+        # Let queued feedback go out before polling stops
+        outbox.drain(timeout=30)
         bot.stop_bot()
+        if webhook_server is not None:
+            webhook_server.stop()
+
+
+@bot.message_handler(commands=["stats"])
+def stats(message: Message):
+    if message.from_user.id in gods:
+        # Telegram cuts messages at 4096 characters
+        outbox.send_message(
+            message.chat.id,
+            "```\n" + registry.summary()[:4000] + "\n```",
+            parse_mode="Markdown",
+        )
 
 
 @bot.message_handler(content_types=["text"])
@@ -744,12 +989,78 @@ def alternative_guess(message: Message):
     if message.text.lower().startswith('guess') and (len(message.text) == 5 or message.text[5] == ' '):
         message.text = '/' + message.text
         guess(message)
-    if message.reply_to_message and message.reply_to_message.from_user.id == bot.get_me().id:
+    if message.reply_to_message and message.reply_to_message.from_user.id == bot.user.id:
         message.text = '/guess ' + message.text
         guess(message)
 
 
 
-start_thread(f=from_queue_processing, logger=logger, delay=delay)
-logger.info("started bot")
-bot.infinity_polling()
+
+def start_background():
+    """Generation workers, queue position edits, metrics and pre-generation."""
+    start_thread(f=from_queue_processing, logger=logger, workers=workers, expected=delay)
+    if queue_edit_batch > 0:
+        queue_notifier.start()
+    if metrics_port:
+        try:
+            MetricsServer(registry, port=metrics_port).start()
+        except OSError as e:
+            # /stats still works; no reason to stay offline over it
+            logger.error(f"ERROR: metrics server on port {metrics_port}: {e}")
+    if pregen_stock > 0:
+        # Pinned to the first provider, so its spare quota is what gets spent
+        PreWarmer(
+            image_cache,
+            IMAGE_CACHE_KEY,
+            provider_generators[providers[0]],
+            rate_limit=provider_clients[providers[0]][1],
+            stock_size=pregen_stock,
+            interval=pregen_interval,
+            reuse=reuse_images,
+            logger=logger,
+        ).start()
+
+
+webhook_server = None
+
+
+def main():
+    global webhook_server
+    start_background()
+    logger.info("started bot")
+
+    if webhook_url:
+        webhook_server = WebhookServer(
+            bot,
+            host=webhook_host,
+            port=webhook_port,
+            path=webhook_path,
+            secret_token=webhook_secret,
+            max_pending=webhook_max_pending,
+            certfile=webhook_cert,
+            keyfile=webhook_key,
+            logger=logger,
+        )
+        with timed_phase("webhook"):
+            webhook_server.start()
+            webhook_server.register(webhook_url)
+        logger.info(f"Startup total: {(time.perf_counter() - boot_started) * 1000:.1f} ms")
+        threading.Thread(target=resume_broadcast, daemon=True).start()
+        webhook_server.wait()
+    else:
+        # getUpdates is refused while a webhook is set
+        bot.remove_webhook()
+        # Serve the first batch of updates before doing anything that is not needed
+        # to answer players
+        with timed_phase("first poll"):
+            bot.process_new_updates(
+                bot.get_updates(offset=None, timeout=0, long_polling_timeout=0)
+            )
+        logger.info(f"Startup total: {(time.perf_counter() - boot_started) * 1000:.1f} ms")
+        threading.Thread(target=resume_broadcast, daemon=True).start()
+
+        bot.infinity_polling()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import sqlite3
+import threading
+import time
+
+from outbox import LOW
+
+
+class Broadcaster:
+    """One message to many chats, sent through the outbox and checkpointed.
+
+    Every recipient of a job has a row in SQLite. Chats are sent ``window``
+    at a time: the window is marked ``sending`` before it is handed to the
+    outbox and each chat is marked ``sent`` or ``failed`` when its call
+    finishes. A job cut short by a crash resumes with the ``pending`` chats
+    only; chats left ``sending`` are skipped rather than risk a duplicate.
+    """
+
+    def __init__(
+        self,
+        outbox,
+        path: str = "database/broadcasts.db",
+        window: int = 200,
+        progress_interval: float = 5.0,
+        logger=None,
+    ):
+        self.outbox = outbox
+        self.window = window
+        self.progress_interval = progress_interval
+        self.logger = logger
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        # One commit per delivered chat; WAL keeps them durable enough
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.executescript(
+            """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            created REAL NOT NULL,
+            finished REAL
+        );
+        CREATE TABLE IF NOT EXISTS deliveries (
+            broadcast_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            PRIMARY KEY (broadcast_id, chat_id)
+        );
+        """
+        )
+        self.__conn.commit()
+
+    def create(self, kind: str, text: str, chat_ids, parse_mode: str | None = None) -> int:
+        with self.__lock, self.__conn:
+            job_id = self.__conn.execute(
+                "INSERT INTO broadcasts (kind, text, parse_mode, created) VALUES (?, ?, ?, ?)",
+                (kind, text, parse_mode, time.time()),
+            ).lastrowid
+            self.__conn.executemany(
+                "INSERT OR IGNORE INTO deliveries (broadcast_id, chat_id) VALUES (?, ?)",
+                ((job_id, int(chat_id)) for chat_id in chat_ids),
+            )
+        return job_id
+
+    def unfinished(self, kind: str) -> list:
+        with self.__lock:
+            return [
+                job_id
+                for job_id, in self.__conn.execute(
+                    "SELECT id FROM broadcasts WHERE kind = ? AND finished IS NULL ORDER BY id",
+                    (kind,),
+                )
+            ]
+
+    def abandon(self, kind: str):
+        """Closes unfinished jobs of ``kind`` without sending the rest."""
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "UPDATE broadcasts SET finished = ? WHERE kind = ? AND finished IS NULL",
+                (time.time(), kind),
+            )
+
+    def counts(self, job_id: int) -> dict:
+        with self.__lock:
+            return dict(
+                self.__conn.execute(
+                    "SELECT status, COUNT(*) FROM deliveries WHERE broadcast_id = ? GROUP BY status",
+                    (job_id,),
+                ).fetchall()
+            )
+
+    def __next_window(self, job_id: int) -> list:
+        with self.__lock, self.__conn:
+            chat_ids = [
+                chat_id
+                for chat_id, in self.__conn.execute(
+                    "SELECT chat_id FROM deliveries WHERE broadcast_id = ? AND status = 'pending' "
+                    "LIMIT ?",
+                    (job_id, self.window),
+                )
+            ]
+            self.__conn.executemany(
+                "UPDATE deliveries SET status = 'sending' WHERE broadcast_id = ? AND chat_id = ?",
+                ((job_id, chat_id) for chat_id in chat_ids),
+            )
+        return chat_ids
+
+    def __record(self, job_id: int, chat_id: int, future):
+        error = future.exception()
+        # One blocked or deleted chat does not stop the others
+        status = "sent" if error is None else "failed"
+        try:
+            with self.__lock, self.__conn:
+                self.__conn.execute(
+                    "UPDATE deliveries SET status = ?, error = ? "
+                    "WHERE broadcast_id = ? AND chat_id = ?",
+                    (status, None if error is None else str(error)[:500], job_id, chat_id),
+                )
+        except sqlite3.Error as e:
+            if self.logger is not None:
+                self.logger.error(f"ERROR: broadcast {job_id} chat {chat_id}: {e}")
+
+    def run(self, job_id: int, progress=None) -> dict:
+        """Sends the pending part of a job; returns the final status counts.
+
+        ``progress(counts)`` is called every ``progress_interval`` seconds and
+        once at the end.
+        """
+        with self.__lock:
+            text, parse_mode = self.__conn.execute(
+                "SELECT text, parse_mode FROM broadcasts WHERE id = ?", (job_id,)
+            ).fetchone()
+        reported = time.monotonic()
+        while True:
+            chat_ids = self.__next_window(job_id)
+            if not chat_ids:
+                break
+            recorded = threading.Semaphore(0)
+
+            def record(future, chat_id):
+                try:
+                    self.__record(job_id, chat_id, future)
+                finally:
+                    recorded.release()
+
+            for chat_id in chat_ids:
+                # Recorded as soon as it is done, so a crash mid-window leaves
+                # only the unfinished chats as sending
+                self.outbox.send_message(
+                    chat_id, text, priority=LOW, parse_mode=parse_mode
+                ).add_done_callback(lambda future, chat_id=chat_id: record(future, chat_id))
+            # Callbacks run after waiters wake, so count them rather than wait()
+            for _ in chat_ids:
+                recorded.acquire()
+
+            if progress is not None and time.monotonic() - reported >= self.progress_interval:
+                reported = time.monotonic()
+                self.__report(progress, job_id)
+
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "UPDATE broadcasts SET finished = ? WHERE id = ?", (time.time(), job_id)
+            )
+        counts = self.counts(job_id)
+        if self.logger is not None:
+            self.logger.info(f"Broadcast {job_id} finished: {counts}")
+        if progress is not None:
+            self.__report(progress, job_id)
+        return counts
+
+    def __report(self, progress, job_id: int):
+        try:
+            progress(self.counts(job_id))
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.error(f"ERROR: {e}")
@@ -0,0 +1,172 @@
+"""Recording of incoming updates, for replaying real traffic in load tests.
+
+Every update the bot receives is appended to a file as one compact JSON line
+``[unix_time, update]``; a path ending in ``.gz`` is gzip-compressed. User and
+chat ids are replaced with keyed hashes, the same for the same id and salt,
+so a player's guesses still land in the same game; names are replaced too.
+Message text is kept, the replay needs the guesses; of a replied-to message
+only its ids and sender are, since the bot's own texts name players. The
+bot's own account is left alone.
+
+``benchmarks/replay.py`` feeds a recording back into the bot.
+"""
+import atexit
+import gzip
+import hashlib
+import hmac
+import json
+import re
+import secrets
+import threading
+import time
+
+CHAT_TYPES = ("private", "group", "supergroup", "channel")
+NAME_FIELDS = ("first_name", "last_name", "username", "title")
+# Names given as plain strings, outside a user or chat object
+SENDER_NAME_FIELDS = ("forward_sender_name", "sender_user_name", "author_signature")
+# What is left of a replied-to message: the bot's texts and captions name
+# players, and replay only needs to see that the reply went to the bot
+REPLY_FIELDS = ("message_id", "date", "chat", "from")
+# Deep links carry the group id: /start pick-1001234567890
+PICK = re.compile(r"pick(-?\d+)")
+
+
+class Anonymiser:
+    """Keyed, sign-preserving replacement for ids and names."""
+
+    def __init__(self, salt: bytes):
+        self.__salt = salt
+
+    def __digest(self, value) -> int:
+        return int.from_bytes(
+            hmac.new(self.__salt, str(value).encode(), hashlib.sha256).digest()[:5], "big"
+        )
+
+    def id(self, value: int) -> int:
+        # Group ids stay negative, the outbox rate-limits them differently;
+        # a private chat's id is its user's id, so both map the same way
+        mapped = self.__digest(abs(value)) + 1
+        return -mapped if value < 0 else mapped
+
+    def name(self, field: str, value: str) -> str:
+        return f"{field}{self.__digest(value) % 10**6}"
+
+    def text(self, text: str) -> str:
+        return PICK.sub(lambda found: f"pick{self.id(int(found[1]))}", text)
+
+    def object(self, value):
+        if isinstance(value, list):
+            return [self.object(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if value.get("is_bot"):
+            return value
+        # A shared contact is a person too, with its id under user_id
+        person = "is_bot" in value or value.get("type") in CHAT_TYPES or "phone_number" in value
+        result = {}
+        for key, item in value.items():
+            if person and key in ("id", "user_id"):
+                result[key] = self.id(item)
+            elif person and key in NAME_FIELDS:
+                result[key] = self.name(key, item)
+            elif key in SENDER_NAME_FIELDS + ("phone_number",) and isinstance(item, str):
+                result[key] = self.name(key, item)
+            elif key == "reply_to_message" and isinstance(item, dict):
+                result[key] = self.object(
+                    {field: part for field, part in item.items() if field in REPLY_FIELDS}
+                )
+            elif key in ("text", "caption") and isinstance(item, str):
+                result[key] = self.text(item)
+            elif key in ("bio", "vcard", "quote", "external_reply"):
+                continue
+            else:
+                result[key] = self.object(item)
+        return result
+
+
+class UpdateRecorder:
+    """Appends anonymised updates to ``path``; flushed every ``flush_interval``.
+
+    Only message updates are kept, they are the only ones the bot handles.
+    Without a ``salt`` ids are consistent within one run only, so recordings
+    spanning restarts need one set in the config.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        salt: str | None = None,
+        flush_interval: float = 1.0,
+        logger=None,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.logger = logger
+        self.anonymiser = Anonymiser((salt or secrets.token_hex(16)).encode())
+        if path.endswith(".gz"):
+            # Each run appends a gzip member; readers see one stream
+            self.__file = gzip.open(path, "at", encoding="utf-8")
+        else:
+            self.__file = open(path, "a", encoding="utf-8", buffering=1 << 16)
+        self.__lock = threading.Lock()
+        self.__recorded = 0
+        self.__closed = threading.Event()
+        threading.Thread(target=self.__run, name="update-recorder", daemon=True).start()
+        atexit.register(self.close)
+
+    def record(self, updates):
+        now = round(time.time(), 3)
+        try:
+            lines = []
+            for update in updates:
+                for field in ("message", "edited_message"):
+                    message = getattr(update, field, None)
+                    if message is not None:
+                        raw = {
+                            "update_id": update.update_id,
+                            field: self.anonymiser.object(message.json),
+                        }
+                        lines.append(
+                            json.dumps([now, raw], ensure_ascii=False, separators=(",", ":"))
+                            + "\n"
+                        )
+                        break
+            with self.__lock:
+                if not self.__closed.is_set():
+                    self.__file.writelines(lines)
+                    self.__recorded += len(lines)
+        except Exception as e:
+            # Losing a recorded update is fine, losing the update is not
+            if self.logger is not None:
+                self.logger.error(f"ERROR: {e}")
+
+    def __run(self):
+        while not self.__closed.wait(self.flush_interval):
+            with self.__lock:
+                if not self.__closed.is_set():
+                    self.__file.flush()
+
+    def recorded(self) -> int:
+        return self.__recorded
+
+    def close(self):
+        with self.__lock:
+            if self.__closed.is_set():
+                return
+            self.__closed.set()
+            self.__file.close()
+
+
+def read_recording(path: str):
+    """Yields ``(unix_time, update)``; a line cut short by a crash ends it."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        try:
+            for line in file:
+                try:
+                    recorded, update = json.loads(line)
+                except ValueError:
+                    return
+                yield recorded, update
+        except EOFError:
+            return
@@ -1,15 +1,54 @@
-import psycopg2
+import atexit
+import threading
+from contextlib import contextmanager
+
+from psycopg2 import Error, InterfaceError, OperationalError
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 
 class PostgreClient:
+    """Users table access shared by all handler threads.
+
+    Registrations and credit changes are buffered and written in one
+    transaction every ``flush_interval`` seconds, or sooner once
+    ``batch_size`` of them are waiting. Users known to exist are remembered,
+    so repeated registrations never reach the database. A row the database
+    rejects is logged and dropped rather than holding up the rest.
+    """
+
     def __init__(
-        self, host: str, dbname: str, user: str, password: str, logger=None
+        self,
+        host: str,
+        dbname: str,
+        user: str,
+        password: str,
+        logger=None,
+        min_connections: int = 1,
+        max_connections: int = 8,
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        max_known: int = 1_000_000,
     ) -> None:
         self.logger = logger
-        self.__conn = psycopg2.connect(
-            f"host={host} dbname={dbname} user={user} password={password}"
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_known = max_known
+        self.__pool = ThreadedConnectionPool(
+            min_connections,
+            max_connections,
+            f"host={host} dbname={dbname} user={user} password={password}",
         )
-        self.__cur = self.__conn.cursor()
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__known: set[int] = set()
+        self.__new_users: set[int] = set()
+        self.__credits: dict[int, int] = {}
+        self.__wake = threading.Event()
+        self.__closed = False
+
+        threading.Thread(target=self.__run, name="postgres-writer", daemon=True).start()
+        atexit.register(self.close)
         if logger is not None:
             self.logger.info("Database connected")
 
@@ -37,53 +76,174 @@ class PostgreClient:
 
         return actual_decorator
 
+    @contextmanager
+    def __cursor(self):
+        # One transaction on a pooled connection: committed unless it raises
+        conn = self.__pool.getconn()
+        try:
+            with conn, conn.cursor() as cur:
+                yield cur
+        finally:
+            self.__pool.putconn(conn)
+
     @log_decorator("table initialized")
     def init_user_table(self):
-        self.__cur.execute(
+        with self.__cursor() as cur:
+            cur.execute(
+                """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id BIGINT PRIMARY KEY,
+                timestamp_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                credits INTEGER DEFAULT 0
+            );
             """
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            timestamp_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            credits INTEGER DEFAULT 0
-        );
-        """
-        )
+            )
+            # Telegram user ids no longer fit the INTEGER of older tables
+            cur.execute(
+                """
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'users' AND column_name = 'user_id'
+            """
+            )
+            if cur.fetchone() == ("integer",):
+                cur.execute("ALTER TABLE users ALTER COLUMN user_id TYPE BIGINT")
+
+    def __remember(self, user_id: int):
+        if len(self.__known) >= self.max_known:
+            self.__known.clear()
+        self.__known.add(user_id)
 
     @log_decorator("Successful interaction 'add_user_if_not_exists'")
     def add_user_if_not_exists(self, user_id):
-        self.__cur.execute("SELECT COUNT(*) FROM users WHERE user_id = %s", (user_id,))
-        count: tuple | None = self.__cur.fetchone()
-
-        if count is not None and count[0] == 0:
-            self.__cur.execute(
-                "INSERT INTO users (user_id) VALUES (%s)",
-                (user_id,),
-            )
-            self.__conn.commit()
+        user_id = int(user_id)
+        with self.__lock:
+            if user_id in self.__known:
+                return
+            self.__remember(user_id)
+            self.__new_users.add(user_id)
+            full = len(self.__new_users) + len(self.__credits) >= self.batch_size
+        if full:
+            self.__wake.set()
 
     @log_decorator("Successful interaction 'get_user_string_by_id'")
     def get_user_string_by_id(self, user_id):
-        self.__cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-        user_string = self.__cur.fetchone()
+        # Reads see buffered writes
+        self.flush()
+        with self.__cursor() as cur:
+            cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+            user_string = cur.fetchone()
         if user_string:
+            with self.__lock:
+                self.__remember(int(user_id))
             return user_string
         else:
             return None
 
     @log_decorator("Successful interaction 'add_credits_to_user'")
     def add_credits_to_user(self, user_id, credits_to_add):
-        self.__cur.execute(
-            "UPDATE users SET credits = credits + %s WHERE user_id = %s",
-            (credits_to_add, user_id),
-        )
-        self.__conn.commit()
+        user_id = int(user_id)
+        with self.__lock:
+            self.__credits[user_id] = self.__credits.get(user_id, 0) + credits_to_add
+            full = len(self.__new_users) + len(self.__credits) >= self.batch_size
+        if full:
+            self.__wake.set()
+
+    def __write(self, new_users, credits: dict):
+        with self.__cursor() as cur:
+            if new_users:
+                execute_values(
+                    cur,
+                    "INSERT INTO users (user_id) VALUES %s ON CONFLICT DO NOTHING",
+                    [(user_id,) for user_id in sorted(new_users)],
+                )
+            if credits:
+                execute_values(
+                    cur,
+                    """
+                UPDATE users SET credits = users.credits + v.credits
+                FROM (VALUES %s) AS v (user_id, credits)
+                WHERE users.user_id = v.user_id
+                """,
+                    sorted(credits.items()),
+                )
+
+    def __put_back(self, new_users, credits: dict):
+        # The next flush retries them
+        with self.__lock:
+            self.__new_users |= set(new_users)
+            for user_id, amount in credits.items():
+                self.__credits[user_id] = self.__credits.get(user_id, 0) + amount
+
+    def __write_each(self, new_users, credits: dict):
+        # One bad row fails the whole batch; find it and drop it alone
+        rows = [({user_id}, {}) for user_id in sorted(new_users)]
+        rows += [(set(), {user_id: amount}) for user_id, amount in sorted(credits.items())]
+        for number, (users, amounts) in enumerate(rows):
+            try:
+                self.__write(users, amounts)
+            except (OperationalError, InterfaceError):
+                for rest_users, rest_amounts in rows[number:]:
+                    self.__put_back(rest_users, rest_amounts)
+                raise
+            except Error as e:
+                user_id = next(iter(users or amounts))
+                with self.__lock:
+                    self.__known.discard(user_id)
+                if self.logger is not None:
+                    self.logger.error(f"ERROR: dropped write for user {user_id}: {e}")
+
+    def flush(self):
+        with self.__flush_lock:
+            with self.__lock:
+                new_users, self.__new_users = self.__new_users, set()
+                credits, self.__credits = self.__credits, {}
+            if not new_users and not credits:
+                return
+            try:
+                self.__write(new_users, credits)
+            except (OperationalError, InterfaceError):
+                # The database is unreachable, not the data at fault
+                self.__put_back(new_users, credits)
+                raise
+            except Error:
+                self.__write_each(new_users, credits)
+            except Exception:
+                self.__put_back(new_users, credits)
+                raise
+
+    def __run(self):
+        while not self.__closed:
+            self.__wake.wait(self.flush_interval)
+            self.__wake.clear()
+            if self.__closed:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"ERROR: {e}")
 
     @log_decorator("Table dropped")
     def drop_table(self, table_name):
-        self.__cur.execute(f"DROP TABLE IF EXISTS {table_name};")
-        self.__conn.commit()
+        with self.__cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {table_name};")
+        with self.__lock:
+            self.__known.clear()
 
     @log_decorator("User deleted")
     def delete_user(self, user_id):
-        self.__cur.execute(f"DELETE FROM users WHERE user_id = {user_id};")
-        self.__conn.commit()
+        self.flush()
+        with self.__cursor() as cur:
+            cur.execute("DELETE FROM users WHERE user_id = %s;", (user_id,))
+        with self.__lock:
+            self.__known.discard(int(user_id))
+
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__wake.set()
+        try:
+            self.flush()
+        finally:
+            self.__pool.closeall()
@@ -0,0 +1,262 @@
+import atexit
+import heapq
+import json
+import os
+import sqlite3
+import threading
+
+
+class Leaderboard:
+    """The ``size`` best (score, word) pairs of a game in a bounded min-heap."""
+
+    def __init__(self, size: int = 100) -> None:
+        self.size = size
+        self.__heap: list[tuple[float, str]] = []
+
+    def add(self, word: str, score: float):
+        if len(self.__heap) < self.size:
+            heapq.heappush(self.__heap, (score, word))
+        elif score > self.__heap[0][0]:
+            heapq.heapreplace(self.__heap, (score, word))
+
+    def top(self, count: int) -> list[tuple[str, float]]:
+        best = sorted(self.__heap, key=lambda item: item[0], reverse=True)[:count]
+        return [(word, score) for score, word in best]
+
+    def __len__(self) -> int:
+        return len(self.__heap)
+
+
+def is_aggregate(scores: list) -> bool:
+    # An old score list of two never starts with an int: a first guess of 100
+    # ends the game, and every other score is a rounded float
+    return len(scores) == 2 and isinstance(scores[0], int)
+
+
+def migrate(data: list) -> list:
+    # Older games stored percentages as "12.34%" strings and every score of
+    # every player; keep numbers and (count, total) per player instead
+    data[1] = {
+        word: float(score[:-1]) if isinstance(score, str) else score
+        for word, score in data[1].items()
+    }
+    data[3] = {
+        user_id: scores if is_aggregate(scores) else [len(scores), sum(scores)]
+        for user_id, scores in data[3].items()
+    }
+    if len(data) < 6:
+        data.append(0)
+    return data
+
+
+class GamesStore:
+    """In-memory game state keyed by chat id with write-behind SQLite persistence.
+
+    Every game is kept as ``[answer, words, file_id, players, user_id, hints]``:
+    ``words`` maps guessed words to their percentage, ``players`` maps user ids
+    to ``[guesses, total percentage]``. Reads and writes touch only the
+    dictionary; changed games are flushed to a WAL-mode SQLite file by a
+    background thread.
+    """
+
+    def __init__(
+        self,
+        path: str = "database/games.db",
+        flush_interval: float = 1.0,
+        compact_interval: float = 300.0,
+        legacy_path: str | None = "database/games.json",
+        logger=None,
+    ) -> None:
+        self.logger = logger
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+
+        self.__games: dict[str, list] = {}
+        self.__tops: dict[str, Leaderboard] = {}
+        self.__dirty: set[str] = set()
+        self.__lock = threading.RLock()
+        self.__io_lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__closed = False
+
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS games (id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        self.__conn.commit()
+
+        self.__load(legacy_path)
+
+        self.__thread = threading.Thread(target=self.__flush_loop, daemon=True)
+        self.__thread.start()
+        atexit.register(self.close)
+
+    def __import(self, legacy_path: str):
+        # One-time import of the TinyDB file used before this store existed;
+        # the file is renamed afterwards so finished games never come back
+        with open(legacy_path, encoding="utf-8") as file:
+            content = file.read().strip()
+        documents = json.loads(content).get("_default", {}) if content else {}
+        with self.__conn:
+            self.__conn.executemany(
+                "INSERT OR IGNORE INTO games (id, data) VALUES (?, ?)",
+                [
+                    (
+                        str(document["id"]),
+                        json.dumps(migrate(document["data"]), ensure_ascii=False),
+                    )
+                    for document in documents.values()
+                ],
+            )
+        os.replace(legacy_path, legacy_path + ".imported")
+        if self.logger is not None:
+            self.logger.info(
+                f"Imported {len(documents)} games from {legacy_path}, "
+                f"renamed to {legacy_path}.imported"
+            )
+
+    def __load(self, legacy_path: str | None):
+        if legacy_path is not None and os.path.exists(legacy_path):
+            self.__import(legacy_path)
+
+        for chat_id, data in self.__conn.execute("SELECT id, data FROM games"):
+            self.__games[chat_id] = migrate(json.loads(data))
+
+        for chat_id, data in self.__games.items():
+            self.__tops[chat_id] = self.__leaderboard(data)
+
+        if self.logger is not None:
+            self.logger.info(f"Games store loaded | games: {len(self.__games)}")
+
+    @staticmethod
+    def __leaderboard(data: list) -> Leaderboard:
+        leaderboard = Leaderboard()
+        for word, score in data[1].items():
+            leaderboard.add(word, score)
+        return leaderboard
+
+    def __mark(self, chat_id: str):
+        self.__dirty.add(chat_id)
+
+    def exists(self, chat_id) -> bool:
+        return str(chat_id) in self.__games
+
+    def get(self, chat_id) -> list | None:
+        return self.__games.get(str(chat_id))
+
+    def ids(self) -> list:
+        with self.__lock:
+            return list(self.__games.keys())
+
+    def __len__(self) -> int:
+        return len(self.__games)
+
+    def upsert(self, chat_id, data: list):
+        with self.__lock:
+            self.__games[str(chat_id)] = data
+            self.__tops[str(chat_id)] = self.__leaderboard(data)
+            self.__mark(str(chat_id))
+
+    def insert_if_absent(self, chat_id, data: list) -> bool:
+        with self.__lock:
+            if str(chat_id) in self.__games:
+                return False
+            self.__games[str(chat_id)] = data
+            self.__tops[str(chat_id)] = self.__leaderboard(data)
+            self.__mark(str(chat_id))
+            return True
+
+    def remove(self, chat_id) -> list | None:
+        with self.__lock:
+            data = self.__games.pop(str(chat_id), None)
+            self.__tops.pop(str(chat_id), None)
+            if data is not None:
+                self.__mark(str(chat_id))
+            return data
+
+    def update(self, chat_id, func):
+        """Atomically apply ``func(data)`` to a game; returns its result or None."""
+        with self.__lock:
+            data = self.__games.get(str(chat_id))
+            if data is None:
+                return None
+            result = func(data)
+            self.__mark(str(chat_id))
+            return result
+
+    def add_guess(self, chat_id, user_id, percentage: float, word: str | None = None):
+        def append(data):
+            if word is not None and word not in data[1]:
+                data[1][word] = percentage
+                self.__tops[str(chat_id)].add(word, percentage)
+            stats = data[3].setdefault(str(user_id), [0, 0.0])
+            stats[0] += 1
+            stats[1] += percentage
+            return data
+
+        return self.update(chat_id, append)
+
+    def top(self, chat_id, count: int) -> list[tuple[str, float]]:
+        """The ``count`` (at most 100) closest guessed words of a game."""
+        with self.__lock:
+            leaderboard = self.__tops.get(str(chat_id))
+            return leaderboard.top(count) if leaderboard is not None else []
+
+    def flush(self):
+        with self.__io_lock:
+            self.__flush()
+
+    def __flush(self):
+        with self.__lock:
+            if not self.__dirty:
+                return
+            changed = []
+            removed = []
+            for chat_id in self.__dirty:
+                data = self.__games.get(chat_id)
+                if data is None:
+                    removed.append((chat_id,))
+                else:
+                    changed.append((chat_id, json.dumps(data, ensure_ascii=False)))
+            self.__dirty.clear()
+
+        try:
+            with self.__conn:
+                self.__conn.executemany(
+                    "INSERT INTO games (id, data) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+                    changed,
+                )
+                self.__conn.executemany("DELETE FROM games WHERE id = ?", removed)
+        except sqlite3.Error as e:
+            # Put the games back so the next flush retries them
+            with self.__lock:
+                self.__dirty.update(chat_id for chat_id, *_ in changed + removed)
+            if self.logger is not None:
+                self.logger.error(f"ERROR: games flush failed: {e}")
+
+    def compact(self):
+        with self.__io_lock:
+            self.__conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def __flush_loop(self):
+        since_compact = 0.0
+        while not self.__closed:
+            self.__wakeup.wait(self.flush_interval)
+            self.flush()
+            since_compact += self.flush_interval
+            if since_compact >= self.compact_interval:
+                self.compact()
+                since_compact = 0.0
+
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__wakeup.set()
+        self.__thread.join()
+        self.flush()
+        self.compact()
+        self.__conn.close()
@@ -0,0 +1,164 @@
+import sqlite3
+import threading
+import time
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result = None
+
+
+class ImageCache:
+    """Generated images keyed by (provider, normalised prompt).
+
+    An entry keeps the image bytes and, once the image has been sent, the
+    Telegram ``file_id`` so it can be re-sent without uploading. Entries expire
+    after ``max_age`` seconds and the least recently used ones are evicted when
+    the stored bytes exceed ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        path: str = "database/images.db",
+        max_bytes: int = 512 * 1024 * 1024,
+        max_age: float = 30 * 24 * 3600,
+        logger=None,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.logger = logger
+        self.__lock = threading.Lock()
+        self.__flights: dict[tuple, _Flight] = {}
+
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            """
+        CREATE TABLE IF NOT EXISTS images (
+            provider TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            image BLOB,
+            file_id TEXT,
+            size INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            used REAL NOT NULL,
+            PRIMARY KEY (provider, prompt)
+        );
+        """
+        )
+        self.__conn.commit()
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        return " ".join(prompt.lower().split())
+
+    def contains(self, provider: str, prompt: str, unsent_only: bool = False) -> bool:
+        query = "SELECT 1 FROM images WHERE provider = ? AND prompt = ? AND created >= ?"
+        if unsent_only:
+            query += " AND file_id IS NULL"
+        with self.__lock:
+            row = self.__conn.execute(
+                query, (provider, self.normalize(prompt), time.time() - self.max_age)
+            ).fetchone()
+        return row is not None
+
+    def get(self, provider: str, prompt: str, unsent_only: bool = False) -> tuple | None:
+        """Returns ``(image_bytes, file_id)`` for a fresh entry, or None.
+
+        With ``unsent_only`` only images that were never shown to anyone
+        (pre-generated ones) are returned.
+        """
+        prompt = self.normalize(prompt)
+        now = time.time()
+        with self.__lock, self.__conn:
+            row = self.__conn.execute(
+                "SELECT image, file_id, created FROM images WHERE provider = ? AND prompt = ?",
+                (provider, prompt),
+            ).fetchone()
+            if row is None or (unsent_only and row[1] is not None):
+                return None
+            if now - row[2] > self.max_age:
+                self.__conn.execute(
+                    "DELETE FROM images WHERE provider = ? AND prompt = ?",
+                    (provider, prompt),
+                )
+                return None
+            self.__conn.execute(
+                "UPDATE images SET used = ? WHERE provider = ? AND prompt = ?",
+                (now, provider, prompt),
+            )
+        return row[0], row[1]
+
+    def put(self, provider: str, prompt: str, image: bytes | None = None, file_id=None):
+        prompt = self.normalize(prompt)
+        now = time.time()
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                """
+            INSERT INTO images (provider, prompt, image, file_id, size, created, used)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (provider, prompt) DO UPDATE SET
+                image = excluded.image, file_id = excluded.file_id,
+                size = excluded.size, created = excluded.created, used = excluded.used
+            """,
+                (provider, prompt, image, file_id, len(image or b""), now, now),
+            )
+            self.__evict(now)
+
+    def set_file_id(self, provider: str, prompt: str, file_id: str):
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "UPDATE images SET file_id = ? WHERE provider = ? AND prompt = ?",
+                (file_id, provider, self.normalize(prompt)),
+            )
+
+    def __evict(self, now: float):
+        self.__conn.execute("DELETE FROM images WHERE created < ?", (now - self.max_age,))
+        total = self.__conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for rowid, size in self.__conn.execute(
+            "SELECT rowid, size FROM images ORDER BY used"
+        ).fetchall():
+            self.__conn.execute("DELETE FROM images WHERE rowid = ?", (rowid,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def get_or_generate(self, provider: str, prompt: str, generate, reuse: bool = True):
+        """Returns ``(status, image_bytes_or_error, file_id)``.
+
+        With ``reuse`` a cached image is returned when there is one, otherwise
+        only a never-sent one is. Concurrent calls for the same key share a
+        single ``generate(prompt)`` call.
+        """
+        cached = self.get(provider, prompt, unsent_only=not reuse)
+        if cached is not None:
+            return 200, cached[0], cached[1]
+
+        key = (provider, self.normalize(prompt))
+        with self.__lock:
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            return flight.result
+
+        flight.result = (500, None, None)
+        try:
+            status, data = generate(prompt)
+            flight.result = (status, data, None)
+            if status == 200:
+                self.put(provider, prompt, image=data)
+        finally:
+            with self.__lock:
+                self.__flights.pop(key, None)
+            flight.event.set()
+
+        if self.logger is not None:
+            self.logger.info(f"Image generated | {provider} | {key[1]} | status {status}")
+        return flight.result
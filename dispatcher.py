@@ -0,0 +1,111 @@
+import queue
+import threading
+
+import telebot
+
+
+def chat_key(update) -> int:
+    """Chat an update belongs to; updates without one are spread by id."""
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = getattr(update, name, None)
+        if message is not None:
+            return message.chat.id
+    callback = getattr(update, "callback_query", None)
+    if callback is not None and callback.message is not None:
+        return callback.message.chat.id
+    for name in ("my_chat_member", "chat_member", "chat_join_request"):
+        member = getattr(update, name, None)
+        if member is not None:
+            return member.chat.id
+    return update.update_id
+
+
+class ChatDispatcher:
+    """Runs tasks on ``workers`` threads, always on the same one for a key.
+
+    Tasks with the same key (a chat id) run one at a time in submit order;
+    different keys run in parallel. Each worker holds at most ``max_pending``
+    tasks, past that ``submit`` blocks, which slows down whoever feeds it.
+    """
+
+    def __init__(self, workers: int = 16, max_pending: int = 1000, logger=None):
+        self.workers = workers
+        self.logger = logger
+        self.__queues = [queue.Queue(max_pending) for _ in range(workers)]
+        self.__lock = threading.Lock()
+        self.__processed = 0
+        self.__stopped = threading.Event()
+
+    def start(self):
+        for number, tasks in enumerate(self.__queues):
+            threading.Thread(
+                target=self.__run, args=[tasks], name=f"update-worker-{number}", daemon=True
+            ).start()
+        return self
+
+    def submit(self, key, func, *args):
+        self.__queues[hash(key) % self.workers].put((func, args))
+
+    def __run(self, tasks: queue.Queue):
+        while True:
+            try:
+                func, args = tasks.get(timeout=0.5)
+            except queue.Empty:
+                if self.__stopped.is_set():
+                    break
+                continue
+            try:
+                func(*args)
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"ERROR: {e}")
+            finally:
+                with self.__lock:
+                    self.__processed += 1
+                tasks.task_done()
+
+    def join(self):
+        """Waits until every task submitted so far has run."""
+        for tasks in self.__queues:
+            tasks.join()
+
+    def stop(self):
+        # Workers finish what is queued, then exit; safe to call from a handler
+        self.__stopped.set()
+
+    def stats(self) -> dict:
+        depths = [tasks.qsize() for tasks in self.__queues]
+        return {
+            "workers": self.workers,
+            "pending": sum(depths),
+            "max_depth": max(depths),
+            "processed": self.__processed,
+        }
+
+
+class DispatchingTeleBot(telebot.TeleBot):
+    """TeleBot that handles each chat's updates in order on a ChatDispatcher.
+
+    Handlers run on the dispatcher threads, so telebot's own pool is off.
+    A ``recorder`` (see ``capture.UpdateRecorder``) gets every batch first.
+    """
+
+    def __init__(self, token: str, dispatcher: ChatDispatcher, recorder=None, **kwargs):
+        super().__init__(token, threaded=False, **kwargs)
+        self.dispatcher = dispatcher
+        self.recorder = recorder
+
+    def process_new_updates(self, updates):
+        if self.recorder is not None:
+            self.recorder.record(updates)
+        for update in updates:
+            # Move the polling offset now, a queued update must not be fetched again
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.dispatcher.submit(
+                chat_key(update), super().process_new_updates, [update]
+            )
+
+    def stop_bot(self):
+        super().stop_bot()
+        self.dispatcher.stop()
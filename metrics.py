@@ -0,0 +1,277 @@
+"""Counters, gauges and histograms in the Prometheus text format.
+
+Instruments are created on the shared ``registry`` by the module that
+updates them; ``MetricsServer`` serves ``registry.render()`` on
+``/metrics`` and ``registry.summary()`` is the short form for chat.
+"""
+import bisect
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds, from a cached lookup to a slow image generation
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120,
+)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        super().__init__(name, help, labels)
+        self.__values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def values(self) -> dict:
+        with self._lock:
+            return dict(self.__values)
+
+    def render(self) -> list:
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+            for key, value in sorted(self.values().items())
+        ]
+
+
+class Gauge(_Metric):
+    """A value that is set, or read from ``func`` at collection time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), func=None) -> None:
+        super().__init__(name, help, labels)
+        self.func = func
+        self.__values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.__values[self._key(labels)] = value
+
+    def values(self) -> dict:
+        if self.func is not None:
+            try:
+                return {(): float(self.func())}
+            except Exception:
+                return {}
+        with self._lock:
+            return dict(self.__values)
+
+    def render(self) -> list:
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+            for key, value in sorted(self.values().items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (not cumulative, last one is +Inf), sum
+        self.__series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.__series.get(key)
+            if series is None:
+                series = self.__series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def timed(self, **labels):
+        """Decorator form of ``time``."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def inner(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+
+            return inner
+
+        return decorator
+
+    def series(self) -> dict:
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self.__series.items()}
+
+    def quantile(self, q: float, **labels) -> float | None:
+        """Estimate from the buckets, interpolating inside the one that holds it."""
+        counts, _ = self.series().get(self._key(labels), (None, 0))
+        if not counts or not sum(counts):
+            return None
+        rank = q * sum(counts)
+        seen = 0
+        for position, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if position == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[position - 1] if position else 0.0
+                upper = self.buckets[position]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def render(self) -> list:
+        lines = self.header()
+        for key, (counts, total) in sorted(self.series().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}"
+                )
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.__metrics: dict[str, _Metric] = {}
+        self.__lock = threading.Lock()
+
+    def __add(self, metric: _Metric) -> _Metric:
+        with self.__lock:
+            # Re-registering returns the existing instrument
+            return self.__metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self.__add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = (), func=None) -> Gauge:
+        return self.__add(Gauge(name, help, labels, func))
+
+    def histogram(
+        self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.__add(Histogram(name, help, labels, buckets))
+
+    def metrics(self) -> list:
+        with self.__lock:
+            return list(self.__metrics.values())
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One line per series: counts and values, p50/p95 for histograms."""
+        lines = []
+        for metric in self.metrics():
+            if isinstance(metric, Histogram):
+                for key, (counts, total) in sorted(metric.series().items()):
+                    labels = dict(zip(metric.labels, key))
+                    count = sum(counts)
+                    p50 = metric.quantile(0.5, **labels)
+                    p95 = metric.quantile(0.95, **labels)
+                    lines.append(
+                        f"{metric.name}{format_labels(metric.labels, key)}: n={count} "
+                        f"avg={total / count * 1000:.1f}ms p50={p50 * 1000:.1f}ms p95={p95 * 1000:.1f}ms"
+                    )
+            else:
+                for key, value in sorted(metric.values().items()):
+                    lines.append(
+                        f"{metric.name}{format_labels(metric.labels, key)}: {format_value(value)}"
+                    )
+        return "\n".join(lines)
+
+
+registry = Registry()
+
+
+class MetricsServer:
+    """Serves ``/metrics`` for Prometheus; binds to localhost by default."""
+
+    def __init__(self, registry: Registry = registry, host: str = "127.0.0.1", port: int = 9100):
+        metrics = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def start(self):
+        threading.Thread(
+            target=self.server.serve_forever, name="metrics-server", daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,116 @@
+"""One-time conversion of GloVe vectors into the memory-mapped format of ``Embeddings``.
+
+Writes two ``.npy`` files next to each other:
+
+* ``<out>.vectors.npy`` - the unit-normalised vectors as a flat float32 (or
+  float16) matrix;
+* ``<out>.words.npy`` - the vocabulary as a sorted fixed-width byte array, row
+  ``i`` of the matrix being the vector of word ``i``.
+
+With ``--dtype int8`` the matrix holds per-row scaled int8 codes and the row
+scales are written to ``<out>.scales.npy``.
+
+Usage: ``python -m models.convert_embeddings --source .vector_cache/glove.6B.50d.txt``
+"""
+import argparse
+import os
+
+import numpy as np
+
+DEFAULT_SOURCE = ".vector_cache/glove.6B.50d.txt"
+DEFAULT_OUT = "models/data/glove.6B.50d"
+
+
+def read_glove(path: str) -> tuple[list, np.ndarray]:
+    words = []
+    vectors = []
+    seen = set()
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            word, *values = line.rstrip().split(" ")
+            if word in seen:
+                continue
+            seen.add(word)
+            words.append(word)
+            vectors.append(np.asarray(values, dtype=np.float32))
+    return words, np.stack(vectors)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class QuantizedMatrix:
+    """Read-only int8 matrix with one float32 scale per row.
+
+    Indexing returns dequantised float32 rows, so it can stand in for a float
+    matrix wherever rows are read with ``matrix[...]``.
+    """
+
+    def __init__(self, codes, scales) -> None:
+        self.codes = codes
+        self.scales = scales
+        self.shape = codes.shape
+        self.dtype = codes.dtype
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, key) -> np.ndarray:
+        codes = np.asarray(self.codes[key], dtype=np.float32)
+        scales = np.asarray(self.scales[key], dtype=np.float32)
+        return codes * (scales[..., None] if codes.ndim > 1 else scales)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """In-memory copy of ``vectors`` stored as ``dtype``."""
+    if np.dtype(dtype) == np.int8:
+        return QuantizedMatrix(*quantize_int8(np.asarray(vectors, dtype=np.float32)))
+    return np.asarray(vectors, dtype=dtype)
+
+
+def convert(source: str, out: str, dtype="float32") -> tuple[str, str]:
+    words, vectors = read_glove(source)
+    vectors = normalize(vectors)
+
+    encoded = np.array([word.encode("utf-8") for word in words])
+    order = np.argsort(encoded, kind="stable")
+
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    vectors_path = out + ".vectors.npy"
+    words_path = out + ".words.npy"
+    vectors = vectors[order]
+    if np.dtype(dtype) == np.int8:
+        codes, scales = quantize_int8(vectors)
+        np.save(vectors_path, codes)
+        np.save(out + ".scales.npy", scales)
+    else:
+        np.save(vectors_path, np.ascontiguousarray(vectors, dtype=dtype))
+    np.save(words_path, encoded[order])
+    return vectors_path, words_path
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--source", default=DEFAULT_SOURCE)
+    argparser.add_argument("--out", default=DEFAULT_OUT)
+    argparser.add_argument(
+        "--dtype", choices=("float32", "float16", "int8"), default="float32"
+    )
+    args = argparser.parse_args()
+
+    paths = convert(args.source, args.out, args.dtype)
+    for path in paths:
+        print(f"{path}: {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
@@ -1,32 +1,55 @@
-from http import client
+import time
+
 from openai import OpenAI
 from openai import BadRequestError, RateLimitError
-import requests
+
+from models.transport import default_transport
 
 
 class OpenaiClient:
-    def __init__(self, api_key):
+    def __init__(self, api_key, rate_limit=None, transport=None, base_url=None):
+        self.rate_limit = rate_limit
+        self.transport = transport if transport is not None else default_transport
         self.__api_key = api_key
-        self.__client = OpenAI(api_key=self.__api_key)
+        self.__client = OpenAI(
+            api_key=self.__api_key,
+            base_url=base_url,
+            timeout=self.transport.timeout[1],
+            max_retries=self.transport.retry.retries,
+        )
 
     def generate_image(self, prompt, model="dall-e-3", n=1) -> list:
         try:
-            response = self.__client.images.generate(
-                model=model,
-                prompt=prompt,
-                size="1024x1024",
-                quality="standard",
-                n=n,
-            )
+            if self.rate_limit is not None:
+                self.rate_limit.acquire()
+            started = time.perf_counter()
+            status = 200
+            try:
+                response = self.__client.images.generate(
+                    model=model,
+                    prompt=prompt,
+                    size="1024x1024",
+                    quality="standard",
+                    n=n,
+                )
+            except Exception as e:
+                status = getattr(e, "status_code", type(e).__name__)
+                raise
+            finally:
+                self.transport.recorder.record(
+                    "api.openai.com POST /v1/images/generations",
+                    time.perf_counter() - started,
+                    status,
+                )
             image_url = response.data[0].url
-            image = requests.get(str(image_url))
-            if image.status_code == 200:
-                return 200, image.content
+            image = self.transport.get(str(image_url), name="/image")
+            if image.status_code != 200:
+                # The URL is short-lived; it is no use as an image
+                return 500, f"image download failed: {image.status_code}"
+            return 200, image.content
         except BadRequestError as e:
             return 400, e.code
         except RateLimitError as e:
             return 429, e.code
         except Exception as e:
             return 500, e
-        else:
-            return 200, response.data[0].url
@@ -1,25 +1,165 @@
+import os
+import re
+import threading
+from functools import lru_cache
+
 import numpy as np
-import nltk
-import torchtext
+
+DEFAULT_PATH = "models/data/glove.6B.50d"
+# Where torchtext keeps the downloaded GloVe text files
+GLOVE_CACHE = ".vector_cache/glove.6B.50d.txt"
 
 
 class Embeddings:
-    def __init__(self):
-        nltk.download("wordnet")
-        self.__glove = torchtext.vocab.GloVe(
-            name="6B", dim=50  # trained on Wikipedia 2014 corpus of 6 billion words
-        )
+    def __init__(
+        self,
+        path: str = DEFAULT_PATH,
+        memo_size: int = 100_000,
+        glove_cache: str = GLOVE_CACHE,
+        neighbour_index: str = "exact",
+        dtype: str | None = None,
+    ):
+        if not os.path.exists(path + ".vectors.npy") and os.path.exists(glove_cache):
+            # Build the store from the local copy once, no network needed
+            from models.convert_embeddings import convert
+
+            convert(glove_cache, path)
+
+        if os.path.exists(path + ".vectors.npy"):
+            # Read-only memory maps: pages are loaded on demand and shared by
+            # every bot process on the host
+            self.__vectors = np.load(path + ".vectors.npy", mmap_mode="r")
+            self.__words = np.load(path + ".words.npy", mmap_mode="r")
+            if os.path.exists(path + ".scales.npy"):
+                from models.convert_embeddings import QuantizedMatrix
+
+                self.__vectors = QuantizedMatrix(
+                    self.__vectors, np.load(path + ".scales.npy", mmap_mode="r")
+                )
+        else:
+            # No local vectors at all: let torchtext download them
+            import torchtext
+
+            glove = torchtext.vocab.GloVe(
+                name="6B", dim=50  # trained on Wikipedia 2014 corpus of 6 billion words
+            )
+            words = np.array([word.encode("utf-8") for word in glove.itos])
+            order = np.argsort(words, kind="stable")
+            self.__vectors = glove.vectors.numpy()[order]
+            self.__words = words[order]
+
+        # Stores converted before vectors were normalised are fixed up in memory
+        sample = np.linalg.norm(np.asarray(self.__vectors[:64], dtype=np.float32), axis=1)
+        if not np.allclose(sample[sample > 0], 1, atol=1e-2):
+            from models.convert_embeddings import normalize
+
+            self.__vectors = normalize(np.asarray(self.__vectors, dtype=np.float32))
+
+        # Quantising a store in memory trades page sharing for a smaller copy;
+        # converting with --dtype keeps both
+        if dtype is not None and np.dtype(dtype) != self.__vectors.dtype:
+            from models.convert_embeddings import quantize
+
+            self.__vectors = quantize(self.__vectors[:], dtype)
+
+        self.dim = self.__vectors.shape[1]
+        self.similarity = lru_cache(maxsize=memo_size)(self.__similarity)
+        self.answer_vector = lru_cache(maxsize=1024)(self.get_embedding)
+
+        self.neighbour_index = neighbour_index
+        self.__index = None
+        self.__index_lock = threading.Lock()
+        self.nearest = lru_cache(maxsize=1024)(self.__nearest)
+
+    @property
+    def vectors(self):
+        return self.__vectors
+
+    @property
+    def words(self):
+        return self.__words
+
+    def word(self, position: int) -> str:
+        return bytes(self.__words[position]).decode("utf-8")
+
+    def index(self, word: str) -> int | None:
+        key = word.encode("utf-8")
+        if len(key) > self.__words.dtype.itemsize:
+            return None
+        position = int(np.searchsorted(self.__words, key))
+        if position < len(self.__words) and self.__words[position] == key:
+            return position
+        return None
 
     def get_embedding(self, word: str):
-        return self.__glove[word]
+        """Unit-length vector of ``word``, or a zero vector for unknown words."""
+        position = self.index(word)
+        if position is None:
+            return np.zeros(self.dim, dtype=np.float32)
+        return np.asarray(self.__vectors[position], dtype=np.float32)
 
-    def activation(self, x: float, b: float = 0.4, n: float = 8.0) -> float:
+    def activation(self, x, b: float = 0.4, n: float = 8.0):
         return 1 / (1 + np.exp(-n * (x - b)))
 
+    def score(self, cosine):
+        similarity = self.activation(cosine) / self.activation(1)
+        return np.minimum(similarity, 0.99)
+
     def cosine_similarity(self, a, b) -> float:
         similarity = np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-        similarity = self.activation(similarity) / self.activation(1)
-        return 0.99 if similarity > 0.99 else similarity
+        return float(self.score(similarity))
+
+    def __similarity(self, answer: str, guess: str) -> float | None:
+        position = self.index(guess)
+        if position is None:
+            return None
+        vector = np.asarray(self.__vectors[position], dtype=np.float32)
+        return float(self.score(np.dot(self.answer_vector(answer), vector)))
+
+    def similarities(self, answer: str, guesses: list) -> np.ndarray:
+        """Scores many guesses against ``answer`` at once; unknown words get NaN."""
+        positions = [self.index(guess) for guess in guesses]
+        known = np.array([position is not None for position in positions], dtype=bool)
+        result = np.full(len(guesses), np.nan, dtype=np.float32)
+        if known.any():
+            rows = np.array([p for p in positions if p is not None], dtype=np.int64)
+            vectors = np.asarray(self.__vectors[rows], dtype=np.float32)
+            result[known] = self.score(vectors @ self.answer_vector(answer))
+        return result
+
+    def index_for_search(self):
+        with self.__index_lock:
+            if self.__index is None:
+                from models.neighbours import ExactIndex, LSHIndex
+
+                if self.neighbour_index == "lsh":
+                    self.__index = LSHIndex(self.__vectors)
+                else:
+                    self.__index = ExactIndex(self.__vectors)
+            return self.__index
+
+    def __nearest(self, word: str, k: int = 10) -> tuple:
+        """The ``k`` closest plain English words to ``word`` with their scores.
+
+        Words that contain the answer or are contained in it (plurals and the
+        like) are skipped, since they would give it away.
+        """
+        position = self.index(word)
+        if position is None:
+            return ()
+        rows, cosines = self.index_for_search().search(self.__vectors[position], k * 4 + 1)
+        result = []
+        for row, cosine in zip(rows, cosines):
+            candidate = self.word(int(row))
+            if (
+                re.fullmatch("[a-z]+", candidate)
+                and word not in candidate
+                and candidate not in word
+            ):
+                result.append((candidate, float(self.score(cosine))))
+            if len(result) == k:
+                break
+        return tuple(result)
 
     @staticmethod
     def exist(x):
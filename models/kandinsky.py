@@ -1,11 +1,19 @@
 import json
 import time
 import base64
-import requests
+
+from models.transport import ProviderError, default_transport
 
 
 class KandinskyClient:
-    def __init__(self, url, api_key, secret_key):
+    def __init__(
+        self, url, api_key, secret_key, rate_limit=None, model_ttl=3600, transport=None
+    ):
+        self.rate_limit = rate_limit
+        self.transport = transport if transport is not None else default_transport
+        self.model_ttl = model_ttl
+        self.__model_id = None
+        self.__model_expires = 0.0
         self.api_key = api_key
         self.secret_key = secret_key
         self.URL = url
@@ -14,12 +22,22 @@ class KandinskyClient:
             "X-Secret": f"Secret {secret_key}",
         }
 
+    def __json(self, response):
+        if response.status_code >= 400:
+            raise ProviderError(response.status_code, response.text)
+        return response.json()
+
     def get_model(self):
-        response = requests.get(
+        if self.__model_id is not None and time.monotonic() < self.__model_expires:
+            return self.__model_id
+
+        response = self.transport.get(
             self.URL + "key/api/v1/models", headers=self.AUTH_HEADERS
         )
-        data = response.json()
-        return data[0]["id"]
+        data = self.__json(response)
+        self.__model_id = data[0]["id"]
+        self.__model_expires = time.monotonic() + self.model_ttl
+        return self.__model_id
 
     def generate(self, prompt: str, model, images=1, width=1024, height=1024):
         params = {
@@ -34,21 +52,22 @@ class KandinskyClient:
             "model_id": (None, model),
             "params": (None, json.dumps(params), "application/json"),
         }
-        response = requests.post(
+        response = self.transport.post(
             self.URL + "key/api/v1/text2image/run",
             headers=self.AUTH_HEADERS,
             files=data,
         )
-        data = response.json()
+        data = self.__json(response)
         return data["uuid"]
 
     def check_generation(self, request_id: str, attempts: int = 10, delay: int = 10):
         while attempts > 0:
-            response = requests.get(
+            response = self.transport.get(
                 self.URL + "key/api/v1/text2image/status/" + request_id,
+                name="/key/api/v1/text2image/status",
                 headers=self.AUTH_HEADERS,
             )
-            data = response.json()
+            data = self.__json(response)
             if data["status"] == "DONE":
                 return [data["images"], data["censored"]]
 
@@ -57,6 +76,8 @@ class KandinskyClient:
 
     def generate_image(self, prompt: str) -> tuple:
         try:
+            if self.rate_limit is not None:
+                self.rate_limit.acquire()
             model_id = self.get_model()
             uuid = self.generate(prompt, model_id)
             images, censored = self.check_generation(uuid)
@@ -64,5 +85,7 @@ class KandinskyClient:
             image_data = base64.b64decode(images[0])
 
             return 400 if censored else 200, image_data
+        except ProviderError as e:
+            return e.status, e
         except Exception as e:
             return 500, e
@@ -0,0 +1,161 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+
+import aiohttp
+
+from models.transport import AsyncHttpTransport, ProviderError, default_recorder
+
+
+class AsyncKandinskyClient:
+    """Fusionbrain client that keeps many generations in flight on one event loop.
+
+    ``generate_image`` has the same signature and return values as
+    ``KandinskyClient.generate_image`` and can be called from any thread; the
+    request itself runs on the client's own loop thread, so waiting callers do
+    not poll the API themselves.
+    """
+
+    def __init__(
+        self,
+        url,
+        api_key,
+        secret_key,
+        rate_limit=None,
+        model_ttl: float = 3600,
+        poll_initial: float = 1.0,
+        poll_factor: float = 1.6,
+        poll_max: float = 10.0,
+        generation_timeout: float = 120,
+        transport: AsyncHttpTransport | None = None,
+    ):
+        self.rate_limit = rate_limit
+        self.transport = (
+            transport
+            if transport is not None
+            else AsyncHttpTransport(recorder=default_recorder)
+        )
+        self.URL = url
+        self.AUTH_HEADERS = {
+            "X-Key": f"Key {api_key}",
+            "X-Secret": f"Secret {secret_key}",
+        }
+        self.model_ttl = model_ttl
+        self.poll_initial = poll_initial
+        self.poll_factor = poll_factor
+        self.poll_max = poll_max
+        self.generation_timeout = generation_timeout
+
+        self.__model_id = None
+        self.__model_expires = 0.0
+        self.__model_lock: asyncio.Lock | None = None
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__loop_lock = threading.Lock()
+
+    def __ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self.__loop_lock:
+            if self.__loop is None:
+                self.__loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self.__loop.run_forever, name="kandinsky-loop", daemon=True
+                ).start()
+            return self.__loop
+
+    async def __request(self, method: str, path: str, name=None, data_factory=None):
+        status, data = await self.transport.request_json(
+            method,
+            self.URL + path,
+            name=name,
+            data_factory=data_factory,
+            headers=self.AUTH_HEADERS,
+        )
+        if status >= 400:
+            raise ProviderError(status, data)
+        return data
+
+    async def __acquire_rate_limit(self):
+        if self.rate_limit is None:
+            return
+        while not self.rate_limit.try_acquire():
+            await asyncio.sleep(self.rate_limit.wait_time())
+
+    async def get_model(self):
+        if self.__model_lock is None:
+            self.__model_lock = asyncio.Lock()
+        # Concurrent generations share a single lookup when the cache is cold
+        async with self.__model_lock:
+            if self.__model_id is not None and time.monotonic() < self.__model_expires:
+                return self.__model_id
+
+            data = await self.__request("GET", "key/api/v1/models")
+            self.__model_id = data[0]["id"]
+            self.__model_expires = time.monotonic() + self.model_ttl
+            return self.__model_id
+
+    async def generate(self, prompt: str, model, images=1, width=1024, height=1024):
+        params = {
+            "type": "GENERATE",
+            "numImages": images,
+            "width": width,
+            "height": height,
+            "generateParams": {"query": f"{prompt}"},
+        }
+
+        def form():
+            data = aiohttp.FormData()
+            data.add_field("model_id", str(model))
+            data.add_field(
+                "params", json.dumps(params), content_type="application/json"
+            )
+            return data
+
+        data = await self.__request(
+            "POST", "key/api/v1/text2image/run", data_factory=form
+        )
+        return data["uuid"]
+
+    async def check_generation(self, request_id: str):
+        # Poll often while a fast result is still likely, then back off
+        deadline = time.monotonic() + self.generation_timeout
+        delay = self.poll_initial
+        while time.monotonic() < deadline:
+            data = await self.__request(
+                "GET",
+                "key/api/v1/text2image/status/" + request_id,
+                name="/key/api/v1/text2image/status",
+            )
+            if data["status"] == "DONE":
+                return [data["images"], data["censored"]]
+            if data["status"] == "FAIL":
+                return None
+
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * self.poll_factor, self.poll_max)
+
+    async def agenerate_image(self, prompt: str) -> tuple:
+        try:
+            await self.__acquire_rate_limit()
+            model_id = await self.get_model()
+            uuid = await self.generate(prompt, model_id)
+            images, censored = await self.check_generation(uuid)
+
+            image_data = base64.b64decode(images[0])
+
+            return 400 if censored else 200, image_data
+        except ProviderError as e:
+            return e.status, e
+        except Exception as e:
+            return 500, e
+
+    def generate_image(self, prompt: str) -> tuple:
+        return asyncio.run_coroutine_threadsafe(
+            self.agenerate_image(prompt), self.__ensure_loop()
+        ).result()
+
+    def close(self):
+        if self.__loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.transport.close(), self.__loop).result()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
@@ -0,0 +1,97 @@
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the ``k`` largest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+class ExactIndex:
+    """Exact maximum inner product search over unit vectors.
+
+    The matrix is scanned in blocks so that a memory-mapped table is never
+    converted to float32 as a whole.
+    """
+
+    def __init__(self, vectors, block_size: int = 65536) -> None:
+        self.vectors = vectors
+        self.block_size = block_size
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(self.vectors), self.block_size):
+            block = np.asarray(
+                self.vectors[start : start + self.block_size], dtype=np.float32
+            )
+            scores = block @ query
+            rows = top_k(scores, k)
+            best_rows = np.concatenate([best_rows, rows + start])
+            best_scores = np.concatenate([best_scores, scores[rows]])
+            keep = top_k(best_scores, k)
+            best_rows, best_scores = best_rows[keep], best_scores[keep]
+        return best_rows, best_scores
+
+
+class LSHIndex:
+    """Approximate search with random-hyperplane (SimHash) tables.
+
+    Each of ``tables`` tables hashes a vector to ``bits`` sign bits. A query
+    collects the rows that share its bucket, or a bucket one bit away when
+    ``probes`` is set, in any table. Then it ranks those candidates exactly.
+    """
+
+    def __init__(
+        self,
+        vectors,
+        bits: int = 14,
+        tables: int = 8,
+        probes: int = 1,
+        seed: int = 0,
+        block_size: int = 65536,
+    ) -> None:
+        self.vectors = vectors
+        self.bits = bits
+        self.probes = probes
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal(
+            (tables, vectors.shape[1], bits)
+        ).astype(np.float32)
+        self.weights = (1 << np.arange(bits, dtype=np.int64))
+
+        codes = np.empty((tables, len(vectors)), dtype=np.int64)
+        for start in range(0, len(vectors), block_size):
+            block = np.asarray(vectors[start : start + block_size], dtype=np.float32)
+            codes[:, start : start + len(block)] = self.__hash(block)
+        self.order = np.argsort(codes, axis=1, kind="stable")
+        self.sorted_codes = np.take_along_axis(codes, self.order, axis=1)
+
+    def __hash(self, block: np.ndarray) -> np.ndarray:
+        # (tables, rows, bits) sign pattern packed into one integer per table
+        signs = np.einsum("rd,tdb->trb", block, self.planes) > 0
+        return signs @ self.weights
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        codes = self.__hash(query[None, :])[:, 0]
+        found = []
+        for table, code in enumerate(codes):
+            probe_codes = [code]
+            if self.probes:
+                probe_codes += [code ^ (1 << bit) for bit in range(self.bits)]
+            for probe in probe_codes:
+                left = np.searchsorted(self.sorted_codes[table], probe, "left")
+                right = np.searchsorted(self.sorted_codes[table], probe, "right")
+                found.append(self.order[table, left:right])
+        return np.unique(np.concatenate(found)) if found else np.empty(0, np.int64)
+
+    def search(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query, dtype=np.float32)
+        rows = self.candidates(query)
+        scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+        keep = top_k(scores, k)
+        return rows[keep], scores[keep]
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SimilarityProfiles:
+    """Sorted answer-vs-vocabulary similarities per game, for guess ranks.
+
+    A profile is built once per game with one pass over the vocabulary; a rank
+    is then a binary search. Profiles are dropped when a game ends, and the
+    least recently used ones are evicted once their total size would exceed
+    ``budget_bytes``.
+    """
+
+    def __init__(
+        self, embeddings, budget_bytes: int = 256 * 1024 * 1024, block_size: int = 65536
+    ):
+        self.embeddings = embeddings
+        self.budget_bytes = budget_bytes
+        self.block_size = block_size
+        self.__profiles: OrderedDict[str, tuple[str, np.ndarray]] = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+        self.__mask = None
+
+    def __plain_words(self) -> np.ndarray:
+        # Only plain words count towards a rank, not numbers or punctuation
+        if self.__mask is None:
+            words = self.embeddings.words
+            self.__mask = np.char.isalpha(np.asarray(words)) & np.char.islower(
+                np.asarray(words)
+            )
+        return self.__mask
+
+    def build(self, game_id, answer: str) -> np.ndarray | None:
+        query = self.embeddings.answer_vector(answer)
+        if not query.any():
+            return None
+        vectors = self.embeddings.vectors
+        mask = self.__plain_words()
+        parts = []
+        for start in range(0, len(vectors), self.block_size):
+            block = np.asarray(vectors[start : start + self.block_size], dtype=np.float32)
+            parts.append((block @ query)[mask[start : start + self.block_size]])
+        profile = np.sort(np.concatenate(parts))
+
+        with self.__lock:
+            self.__drop(str(game_id))
+            while self.__profiles and self.__size + profile.nbytes > self.budget_bytes:
+                self.__drop(next(iter(self.__profiles)))
+            self.__profiles[str(game_id)] = (answer, profile)
+            self.__size += profile.nbytes
+        return profile
+
+    def __drop(self, game_id: str):
+        entry = self.__profiles.pop(game_id, None)
+        if entry is not None:
+            self.__size -= entry[1].nbytes
+
+    def get(self, game_id, answer: str) -> np.ndarray | None:
+        with self.__lock:
+            entry = self.__profiles.get(str(game_id))
+            if entry is not None and entry[0] == answer:
+                self.__profiles.move_to_end(str(game_id))
+                return entry[1]
+        return self.build(game_id, answer)
+
+    def rank(self, game_id, answer: str, guess: str) -> int | None:
+        """1-based position of ``guess`` among the words closest to ``answer``."""
+        profile = self.get(game_id, answer)
+        position = self.embeddings.index(guess)
+        if profile is None or position is None:
+            return None
+        vector = np.asarray(self.embeddings.vectors[position], dtype=np.float32)
+        cosine = float(vector @ self.embeddings.answer_vector(answer))
+        # Words closer than the guess include the answer itself, so this count
+        # is already the guess's 1-based rank
+        closer = len(profile) - int(np.searchsorted(profile, cosine + 1e-6, "right"))
+        return max(closer, 1)
+
+    def release(self, game_id):
+        with self.__lock:
+            self.__drop(str(game_id))
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def __len__(self) -> int:
+        return len(self.__profiles)
@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# An image, or a prompt the provider refused; anything else is provider
+# trouble (429, 5xx, timeouts, bad credentials) and worth another provider
+ANSWERED_STATUSES = (200, 400)
+
+
+def answered(status) -> bool:
+    return status in ANSWERED_STATUSES
+
+
+class ProviderHealth:
+    """Recent latencies and outcomes of one provider."""
+
+    def __init__(self, name: str, generate, rate_limit=None, window: int = 50):
+        self.name = name
+        self.generate = generate
+        self.rate_limit = rate_limit
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failures_in_row = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+
+    def record(self, seconds: float, status):
+        self.requests += 1
+        failed = not answered(status)
+        self.outcomes.append(failed)
+        if failed:
+            self.failures_in_row += 1
+        else:
+            self.failures_in_row = 0
+            self.latencies.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class ProviderRouter:
+    """Sends each image request to the provider that is healthiest and fastest.
+
+    Providers are added in order of preference, which decides until each has
+    ``min_samples`` latencies. While the chosen provider's request has run for
+    longer than its ``hedge_quantile`` latency, a second request is started
+    on the next provider and the first good image wins. After
+    ``failure_threshold`` failures (429, 5xx, errors) in a row a provider is
+    skipped for ``cooldown`` seconds, unless every provider is, and a failed
+    request moves on to the next provider.
+    """
+
+    def __init__(
+        self,
+        hedge_quantile: float = 0.95,
+        min_samples: int = 5,
+        failure_threshold: int = 3,
+        cooldown: float = 60.0,
+        max_error_rate: float = 0.5,
+        window: int = 50,
+        max_workers: int = 16,
+        logger=None,
+    ):
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.logger = logger
+        self.__providers: list[ProviderHealth] = []
+        self.__executor = ThreadPoolExecutor(max_workers, thread_name_prefix="provider")
+        self.__lock = threading.Lock()
+        self.__hedges = 0
+        self.__hedge_wins = 0
+        self.__failovers = 0
+
+    def add(self, name: str, generate, rate_limit=None):
+        """``generate(prompt)`` returns ``(status, data)`` like the clients in ``models``."""
+        self.__providers.append(ProviderHealth(name, generate, rate_limit, self.window))
+        return self
+
+    def ranked(self) -> list:
+        now = time.monotonic()
+        with self.__lock:
+
+            def key(item):
+                position, provider = item
+                known = len(provider.latencies) >= self.min_samples
+                return (
+                    provider.cooldown_until > now,
+                    provider.error_rate() > self.max_error_rate,
+                    provider.quantile(0.5) if known else float("inf"),
+                    position,
+                )
+
+            return [provider for _, provider in sorted(enumerate(self.__providers), key=key)]
+
+    def __hedge_after(self, provider: ProviderHealth) -> float | None:
+        with self.__lock:
+            if len(provider.latencies) < self.min_samples:
+                return None
+            return provider.quantile(self.hedge_quantile)
+
+    def __has_quota(self, provider: ProviderHealth) -> bool:
+        # A hedge is optional; it must not wait for, or take, a reserved slot
+        return provider.rate_limit is None or provider.rate_limit.available >= 1
+
+    def __call(self, provider: ProviderHealth, prompt: str) -> tuple:
+        started = time.monotonic()
+        try:
+            status, data = provider.generate(prompt)
+        except Exception as e:
+            status, data = 500, e
+        with self.__lock:
+            provider.record(time.monotonic() - started, status)
+            if provider.failures_in_row >= self.failure_threshold:
+                if provider.cooldown_until <= time.monotonic() and self.logger is not None:
+                    self.logger.error(
+                        f"ERROR: {provider.name} failed {provider.failures_in_row} times in a row, "
+                        f"skipped for {self.cooldown:.0f} s"
+                    )
+                provider.cooldown_until = time.monotonic() + self.cooldown
+        return provider.name, status, data
+
+    def generate_image(self, prompt: str, hedge: bool = True) -> tuple:
+        ranked = self.ranked()
+        if not ranked:
+            return 500, "no image providers"
+        now = time.monotonic()
+        candidates = [p for p in ranked if p.cooldown_until <= now] or ranked[:1]
+        result = None
+        running = {}
+        while candidates or running:
+            if not running:
+                if result is not None:
+                    with self.__lock:
+                        self.__failovers += 1
+                provider = candidates.pop(0)
+                running[self.__executor.submit(self.__call, provider, prompt)] = provider
+                started = time.monotonic()
+                hedge_after = self.__hedge_after(provider) if hedge else None
+
+            timeout = None
+            if hedge_after is not None and candidates and len(running) == 1:
+                timeout = max(0.0, started + hedge_after - time.monotonic())
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # Slower than usual: race the next provider that has quota
+                hedge_after = None
+                backup = next((p for p in candidates if self.__has_quota(p)), None)
+                if backup is not None:
+                    candidates.remove(backup)
+                    running[self.__executor.submit(self.__call, backup, prompt)] = backup
+                    with self.__lock:
+                        self.__hedges += 1
+                continue
+
+            for future in done:
+                running.pop(future)
+                name, status, data = future.result()
+                result = (status, data)
+                if answered(status):
+                    if running:
+                        # The other request still finishes and is measured
+                        with self.__lock:
+                            self.__hedge_wins += name != provider.name
+                    return result
+        return result
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self.__lock:
+            return {
+                "hedges": self.__hedges,
+                "hedge_wins": self.__hedge_wins,
+                "failovers": self.__failovers,
+                "providers": {
+                    provider.name: {
+                        "requests": provider.requests,
+                        "p50": provider.quantile(0.5),
+                        "p95": provider.quantile(0.95),
+                        "error_rate": provider.error_rate(),
+                        "cooling_down": provider.cooldown_until > now,
+                    }
+                    for provider in self.__providers
+                },
+            }
+
+    def close(self):
+        self.__executor.shutdown(wait=False)
@@ -0,0 +1,231 @@
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ProviderError(Exception):
+    def __init__(self, status: int, detail=None) -> None:
+        super().__init__(f"HTTP {status}: {detail}")
+        self.status = status
+        self.detail = detail
+
+
+class LatencyRecorder:
+    """Keeps the last ``window`` latencies and status codes per request name."""
+
+    def __init__(self, window: int = 1000) -> None:
+        self.__samples = defaultdict(lambda: deque(maxlen=window))
+        self.__statuses = defaultdict(lambda: defaultdict(int))
+        self.__lock = threading.Lock()
+        self.listeners = []
+
+    def record(self, name: str, seconds: float, status: int | str):
+        with self.__lock:
+            self.__samples[name].append(seconds)
+            self.__statuses[name][status] += 1
+        for listener in self.listeners:
+            listener(name, seconds, status)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            result = {}
+            for name, samples in self.__samples.items():
+                ordered = sorted(samples)
+                result[name] = {
+                    "count": len(ordered),
+                    "mean": sum(ordered) / len(ordered),
+                    "p50": ordered[len(ordered) // 2],
+                    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    "statuses": dict(self.__statuses[name]),
+                }
+            return result
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        retries: int = 3,
+        backoff: float = 0.5,
+        backoff_max: float = 10.0,
+        statuses: tuple = RETRY_STATUSES,
+    ) -> None:
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.statuses = statuses
+
+    def delay(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter: spread retries of many workers over the whole window
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+
+
+def request_name(method: str, url: str, name: str | None) -> str:
+    parts = urlsplit(url)
+    return f"{parts.netloc} {method} {name or parts.path}"
+
+
+class HttpTransport:
+    """Pooled ``requests`` sessions (one per host) with timeouts and retries."""
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        pool_size: int = 16,
+        retry: RetryPolicy | None = None,
+        recorder: LatencyRecorder | None = None,
+    ) -> None:
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.recorder = recorder if recorder is not None else LatencyRecorder()
+        self.__sessions: dict[str, requests.Session] = {}
+        self.__lock = threading.Lock()
+
+    def session(self, url: str) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self.__lock:
+            session = self.__sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.__sessions[host] = session
+            return session
+
+    def request(
+        self, method: str, url: str, name: str | None = None, **kwargs
+    ) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        label = request_name(method, url, name)
+        session = self.session(url)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.recorder.record(label, time.perf_counter() - started, type(e).__name__)
+                # Only idempotent requests are resent after a network error
+                if method != "GET" or attempt >= self.retry.retries:
+                    raise
+            else:
+                self.recorder.record(
+                    label, time.perf_counter() - started, response.status_code
+                )
+                if (
+                    response.status_code not in self.retry.statuses
+                    or attempt >= self.retry.retries
+                ):
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                time.sleep(self.retry.delay(attempt, retry_after))
+                attempt += 1
+                continue
+            time.sleep(self.retry.delay(attempt))
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        with self.__lock:
+            for session in self.__sessions.values():
+                session.close()
+            self.__sessions.clear()
+
+
+class AsyncHttpTransport:
+    """aiohttp counterpart of ``HttpTransport``; must be used from one event loop."""
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        pool_size: int = 100,
+        retry: RetryPolicy | None = None,
+        recorder: LatencyRecorder | None = None,
+    ) -> None:
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.pool_size = pool_size
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.recorder = recorder if recorder is not None else LatencyRecorder()
+        self.__sessions: dict[str, aiohttp.ClientSession] = {}
+
+    def session(self, url: str) -> aiohttp.ClientSession:
+        host = urlsplit(url).netloc
+        session = self.__sessions.get(host)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+            )
+            self.__sessions[host] = session
+        return session
+
+    async def request_json(
+        self, method: str, url: str, name: str | None = None, data_factory=None, **kwargs
+    ):
+        """Sends a request and returns ``(status, json)``.
+
+        ``data_factory`` builds a fresh request body for every attempt, since
+        aiohttp form data cannot be sent twice.
+        """
+        label = request_name(method, url, name)
+        session = self.session(url)
+        attempt = 0
+        while True:
+            if data_factory is not None:
+                kwargs["data"] = data_factory()
+            started = time.perf_counter()
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+                    try:
+                        payload = await response.json(content_type=None)
+                    except ValueError:
+                        payload = None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self.recorder.record(label, time.perf_counter() - started, type(e).__name__)
+                if method != "GET" or attempt >= self.retry.retries:
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+
+            self.recorder.record(label, time.perf_counter() - started, status)
+            if status not in self.retry.statuses or attempt >= self.retry.retries:
+                return status, payload
+            await asyncio.sleep(self.retry.delay(attempt, retry_after))
+            attempt += 1
+
+    async def close(self):
+        for session in self.__sessions.values():
+            await session.close()
+        self.__sessions.clear()
+
+
+# Shared by every provider client unless one is given explicitly
+default_recorder = LatencyRecorder()
+default_transport = HttpTransport(recorder=default_recorder)
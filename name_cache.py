@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+class NameCache:
+    """First names of chat members, filled from incoming messages, with a TTL."""
+
+    def __init__(self, ttl: float = 24 * 3600, max_size: int = 100_000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.__names: dict[tuple[str, str], tuple[str, float]] = {}
+        self.__lock = threading.Lock()
+
+    def remember(self, chat_id, user):
+        with self.__lock:
+            if len(self.__names) >= self.max_size:
+                self.__purge()
+            self.__names[(str(chat_id), str(user.id))] = (
+                user.first_name,
+                time.monotonic() + self.ttl,
+            )
+
+    def get(self, chat_id, user_id) -> str | None:
+        entry = self.__names.get((str(chat_id), str(user_id)))
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def get_or_fetch(self, bot, chat_id, user_id) -> str:
+        name = self.get(chat_id, user_id)
+        if name is None:
+            user = bot.get_chat_member(chat_id, str(user_id)).user
+            self.remember(chat_id, user)
+            name = user.first_name
+        return name
+
+    def __purge(self):
+        now = time.monotonic()
+        for key in [key for key, (_, expires) in self.__names.items() if expires < now]:
+            del self.__names[key]
+        # Still full: drop the oldest half (dicts keep insertion order)
+        if len(self.__names) >= self.max_size:
+            for key in list(self.__names)[: len(self.__names) // 2]:
+                del self.__names[key]
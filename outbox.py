@@ -0,0 +1,308 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+from telebot.apihelper import ApiTelegramException
+
+from metrics import registry
+from rate_limit import TokenBucket
+
+SEND_LATENCY = registry.histogram(
+    "telegram_send_seconds", "Latency of Bot API calls made by the outbox", ("method",)
+)
+SEND_ERRORS = registry.counter(
+    "telegram_send_errors_total", "Failed Bot API calls by error code", ("method", "code")
+)
+
+# Message priorities, lower is sent first
+HIGH = 0  # game start and finish
+NORMAL = 1
+LOW = 2  # routine guess feedback
+
+# Telegram rejects longer texts
+MAX_TEXT = 4096
+
+# Bot methods that take chat_id as a keyword, after the other arguments
+CHAT_KEYWORD_METHODS = {"edit_message_text"}
+
+
+class _Job:
+    __slots__ = (
+        "priority", "seq", "chat_id", "method", "args", "kwargs", "future", "attempts", "lines"
+    )
+
+    def __init__(self, priority, seq, chat_id, method, args, kwargs, lines=None):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.attempts = 0
+        self.lines = lines
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Outbox:
+    """Sends bot API calls from a few threads within Telegram's flood limits.
+
+    Calls are queued by priority and go out at most ``global_rate`` per
+    second in total, ``private_rate`` per second to one private chat and
+    ``group_rpm`` per minute to one group. A chat never has two calls in
+    flight, so its messages keep their order within a priority. A 429 answer
+    pauses the chat for the ``retry_after`` Telegram asks for and the call is
+    retried.
+
+    ``send_digest`` lines for a chat that arrive while it waits for its turn
+    (rate limited, or another call in flight), and within ``digest_window``
+    seconds if set, go out as one message.
+    """
+
+    def __init__(
+        self,
+        bot,
+        senders: int = 4,
+        global_rate: float = 30,
+        private_rate: float = 1,
+        group_rpm: float = 20,
+        group_burst: float = 3,
+        digest_window: float = 0.0,
+        max_attempts: int = 5,
+        max_chats: int = 10_000,
+        logger=None,
+    ):
+        self.bot = bot
+        self.senders = senders
+        self.private_rate = private_rate
+        self.group_rpm = group_rpm
+        self.group_burst = group_burst
+        self.digest_window = digest_window
+        self.max_attempts = max_attempts
+        self.max_chats = max_chats
+        self.logger = logger
+
+        self.__global = TokenBucket(global_rate)
+        self.__buckets: dict[int, TokenBucket] = {}
+        self.__cond = threading.Condition()
+        self.__seq = itertools.count()
+        self.__ready: list[_Job] = []
+        self.__delayed: list[tuple[float, int, _Job]] = []
+        self.__parked: dict[int, list[_Job]] = {}
+        self.__busy: set[int] = set()
+        self.__digests: dict[int, _Job] = {}
+        self.__stopped = False
+        self.__sent = 0
+        self.__retried = 0
+
+    def start(self):
+        for number in range(self.senders):
+            threading.Thread(
+                target=self.__run, name=f"outbox-sender-{number}", daemon=True
+            ).start()
+        return self
+
+    def submit(self, method: str, chat_id, *args, priority: int = NORMAL, **kwargs) -> Future:
+        """Queues ``bot.<method>(chat_id, *args, **kwargs)``; the future gets its result."""
+        with self.__cond:
+            job = _Job(priority, next(self.__seq), int(chat_id), method, args, kwargs)
+            heapq.heappush(self.__ready, job)
+            self.__cond.notify_all()
+        return job.future
+
+    def send_message(self, chat_id, text, priority: int = NORMAL, **kwargs) -> Future:
+        return self.submit("send_message", chat_id, text, priority=priority, **kwargs)
+
+    def send_photo(self, chat_id, photo, caption=None, priority: int = NORMAL, **kwargs) -> Future:
+        return self.submit("send_photo", chat_id, photo, caption, priority=priority, **kwargs)
+
+    def delete_message(self, chat_id, message_id, priority: int = NORMAL) -> Future:
+        return self.submit("delete_message", chat_id, message_id, priority=priority)
+
+    def edit_message_text(
+        self, chat_id, message_id, text, priority: int = NORMAL, **kwargs
+    ) -> Future:
+        return self.submit(
+            "edit_message_text", chat_id, text, priority=priority, message_id=message_id, **kwargs
+        )
+
+    def send_digest(self, chat_id, line: str, **kwargs) -> Future:
+        """Low priority line that may be merged with others for the same chat."""
+        chat_id = int(chat_id)
+        with self.__cond:
+            job = self.__digests.get(chat_id)
+            if (
+                job is not None
+                and job.kwargs == kwargs
+                and sum(len(text) + 1 for text in job.lines) + len(line) <= MAX_TEXT
+            ):
+                job.lines.append(line)
+                return job.future
+            job = _Job(LOW, next(self.__seq), chat_id, "send_message", (), kwargs, [line])
+            self.__digests[chat_id] = job
+            if self.digest_window > 0:
+                self.__defer(job, self.digest_window)
+            else:
+                heapq.heappush(self.__ready, job)
+            self.__cond.notify_all()
+        return job.future
+
+    def __bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.__buckets.get(chat_id)
+        if bucket is None:
+            if len(self.__buckets) >= self.max_chats:
+                # Forget chats whose bucket has refilled, they start full anyway
+                for key in [
+                    key
+                    for key, old in self.__buckets.items()
+                    if key not in self.__busy and old.available >= old.capacity
+                ]:
+                    del self.__buckets[key]
+            if chat_id < 0:
+                bucket = TokenBucket.per_minute(self.group_rpm, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate)
+            self.__buckets[chat_id] = bucket
+        return bucket
+
+    def __defer(self, job: _Job, seconds: float):
+        heapq.heappush(self.__delayed, (time.monotonic() + seconds, job.seq, job))
+
+    def __next_job(self) -> _Job | None:
+        with self.__cond:
+            while True:
+                now = time.monotonic()
+                while self.__delayed and self.__delayed[0][0] <= now:
+                    heapq.heappush(self.__ready, heapq.heappop(self.__delayed)[2])
+
+                job = None
+                while self.__ready:
+                    candidate = heapq.heappop(self.__ready)
+                    if candidate.chat_id in self.__busy:
+                        self.__parked.setdefault(candidate.chat_id, []).append(candidate)
+                        continue
+                    wait = self.__bucket(candidate.chat_id).wait_time()
+                    if wait > 0:
+                        self.__defer(candidate, wait)
+                        continue
+                    job = candidate
+                    break
+
+                if job is None:
+                    if self.__stopped:
+                        return None
+                    timeout = self.__delayed[0][0] - now if self.__delayed else None
+                    self.__cond.wait(timeout)
+                    continue
+
+                wait = self.__global.wait_time()
+                if wait > 0:
+                    heapq.heappush(self.__ready, job)
+                    self.__cond.wait(wait)
+                    continue
+
+                self.__global.try_acquire()
+                self.__bucket(job.chat_id).try_acquire()
+                self.__busy.add(job.chat_id)
+                if job.lines is not None:
+                    # Later lines start a new digest
+                    if self.__digests.get(job.chat_id) is job:
+                        del self.__digests[job.chat_id]
+                    job.args = ("\n".join(job.lines),)
+                return job
+
+    def __release(self, job: _Job, retry_after: float | None = None):
+        with self.__cond:
+            self.__busy.discard(job.chat_id)
+            if retry_after is not None:
+                self.__defer(job, retry_after)
+            for parked in self.__parked.pop(job.chat_id, ()):
+                heapq.heappush(self.__ready, parked)
+            self.__cond.notify_all()
+
+    @staticmethod
+    def retry_after(error: ApiTelegramException) -> float | None:
+        if error.error_code != 429:
+            return None
+        parameters = (error.result_json or {}).get("parameters") or {}
+        return float(parameters.get("retry_after", 1))
+
+    def __run(self):
+        while True:
+            job = self.__next_job()
+            if job is None:
+                return
+            started = time.perf_counter()
+            try:
+                call = getattr(self.bot, job.method)
+                if job.method in CHAT_KEYWORD_METHODS:
+                    result = call(*job.args, chat_id=job.chat_id, **job.kwargs)
+                else:
+                    result = call(job.chat_id, *job.args, **job.kwargs)
+            except ApiTelegramException as e:
+                SEND_ERRORS.inc(method=job.method, code=e.error_code)
+                retry_after = self.retry_after(e)
+                if retry_after is not None and job.attempts < self.max_attempts:
+                    job.attempts += 1
+                    self.__bucket(job.chat_id).penalize(retry_after)
+                    if self.logger is not None:
+                        self.logger.info(
+                            f"Flood limit | chat {job.chat_id} | retry after {retry_after} s"
+                        )
+                    with self.__cond:
+                        self.__retried += 1
+                    self.__release(job, retry_after)
+                    continue
+                self.__fail(job, e)
+            except Exception as e:
+                SEND_ERRORS.inc(method=job.method, code=type(e).__name__)
+                self.__fail(job, e)
+            else:
+                SEND_LATENCY.observe(time.perf_counter() - started, method=job.method)
+                job.future.set_result(result)
+                with self.__cond:
+                    self.__sent += 1
+            self.__release(job)
+
+    def __fail(self, job: _Job, error: Exception):
+        job.future.set_exception(error)
+        if self.logger is not None:
+            self.logger.error(f"ERROR: {job.method} to {job.chat_id}: {error}")
+
+    def pending(self) -> int:
+        with self.__cond:
+            return (
+                len(self.__ready)
+                + len(self.__delayed)
+                + len(self.__busy)
+                + sum(len(jobs) for jobs in self.__parked.values())
+            )
+
+    def drain(self, timeout: float | None = None) -> bool:
+        """Waits until everything queued so far has been sent or has failed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__cond:
+            while self.__ready or self.__delayed or self.__busy or self.__parked:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__cond.wait(remaining if remaining is not None else 0.5)
+        return True
+
+    def stop(self):
+        with self.__cond:
+            self.__stopped = True
+            self.__cond.notify_all()
+
+    def stats(self) -> dict:
+        with self.__cond:
+            return {
+                "pending": len(self.__ready) + len(self.__delayed),
+                "busy_chats": len(self.__busy),
+                "sent": self.__sent,
+                "retried": self.__retried,
+            }
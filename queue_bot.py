@@ -1,9 +1,169 @@
+import heapq
+import json
+import os
+import sqlite3
 import threading
 import time
-from tinydb import TinyDB, Query
+from collections import deque
 
-queue_db = TinyDB("database/queue.json")
-User = Query()
+from metrics import registry
+from outbox import LOW
+
+QUEUE_WAIT = registry.histogram(
+    "generation_queue_wait_seconds", "Time a generation request waited in the queue"
+)
+PROCESSING_TIME = registry.histogram(
+    "generation_processing_seconds", "Time a worker spent on one generation request"
+)
+
+
+class RequestQueue:
+    """Persistent FIFO of generation requests.
+
+    Items live in SQLite until they are acknowledged. A dequeued item is only
+    leased, so if the process dies mid-generation it is handed out again on the
+    next start, at the head of the queue.
+    """
+
+    def __init__(
+        self, path: str = "database/queue.db", legacy_path: str | None = None
+    ) -> None:
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL, leased_at REAL)"
+        )
+        columns = [row[1] for row in self.__conn.execute("PRAGMA table_info(queue)")]
+        if "created" not in columns:
+            self.__conn.execute("ALTER TABLE queue ADD COLUMN created REAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS picks ("
+            "word TEXT PRIMARY KEY, count INTEGER NOT NULL, last REAL NOT NULL)"
+        )
+        # Leases left over from a crashed run are given back to the queue
+        self.__conn.execute("UPDATE queue SET leased_at = NULL")
+        self.__conn.commit()
+
+        if legacy_path is not None and os.path.exists(legacy_path):
+            self.__import(legacy_path)
+
+        self.__pending = deque(
+            (item_id, tuple(json.loads(data)))
+            for item_id, data in self.__conn.execute(
+                "SELECT id, data FROM queue ORDER BY id"
+            )
+        )
+        # Enqueue time of pending and leased items, for wait statistics
+        self.__created: dict[int, float] = {
+            item_id: created
+            for item_id, created in self.__conn.execute(
+                "SELECT id, created FROM queue WHERE created IS NOT NULL"
+            )
+        }
+        self.__leased: dict[int, float] = {}
+        self.__cond = threading.Condition()
+        self.__closed = False
+
+    def __import(self, legacy_path: str):
+        # One-time import of the TinyDB queue; the file is renamed afterwards
+        # so finished requests are not generated again on the next start
+        with open(legacy_path, encoding="utf-8") as file:
+            content = file.read().strip()
+        documents = json.loads(content).get("_default", {}) if content else {}
+        created = time.time()
+        with self.__conn:
+            self.__conn.executemany(
+                "INSERT INTO queue (data, created) VALUES (?, ?)",
+                [
+                    (json.dumps(documents[key]["data"], ensure_ascii=False), created)
+                    for key in sorted(documents, key=int)
+                ],
+            )
+        os.replace(legacy_path, legacy_path + ".imported")
+
+    def put(self, data: tuple) -> int:
+        with self.__cond:
+            created = time.time()
+            with self.__conn:
+                item_id = self.__conn.execute(
+                    "INSERT INTO queue (data, created) VALUES (?, ?)",
+                    (json.dumps(data, ensure_ascii=False), created),
+                ).lastrowid
+            self.__pending.append((item_id, tuple(data)))
+            self.__created[item_id] = created
+            self.__cond.notify()
+        return item_id
+
+    def get(self, timeout: float | None = None) -> tuple | None:
+        """Blocks until an item arrives and leases it; returns (id, data) or None."""
+        with self.__cond:
+            if not self.__cond.wait_for(
+                lambda: self.__pending or self.__closed, timeout
+            ):
+                return None
+            if self.__closed:
+                return None
+            item_id, data = self.__pending.popleft()
+            leased_at = time.time()
+            self.__leased[item_id] = leased_at
+            with self.__conn:
+                self.__conn.execute(
+                    "UPDATE queue SET leased_at = ? WHERE id = ?", (leased_at, item_id)
+                )
+        return item_id, data
+
+    def waiting(self) -> list:
+        """(id, data) of the items not handed out yet, in queue order."""
+        with self.__cond:
+            return list(self.__pending)
+
+    def waited(self, item_id: int) -> float | None:
+        """Seconds a leased item spent in the queue, if its enqueue time is known."""
+        with self.__cond:
+            created = self.__created.get(item_id)
+            leased_at = self.__leased.get(item_id)
+        if created is None or leased_at is None:
+            return None
+        return max(0.0, leased_at - created)
+
+    def ack(self, item_id: int):
+        with self.__cond:
+            self.__leased.pop(item_id, None)
+            self.__created.pop(item_id, None)
+            with self.__conn:
+                self.__conn.execute("DELETE FROM queue WHERE id = ?", (item_id,))
+
+    def record_pick(self, word: str):
+        with self.__cond, self.__conn:
+            self.__conn.execute(
+                "INSERT INTO picks (word, count, last) VALUES (?, 1, ?) "
+                "ON CONFLICT(word) DO UPDATE SET count = count + 1, last = excluded.last",
+                (word, time.time()),
+            )
+
+    def top_picks(self, limit: int, min_count: int = 1) -> list:
+        with self.__cond:
+            return [
+                word
+                for word, in self.__conn.execute(
+                    "SELECT word FROM picks WHERE count >= ? "
+                    "ORDER BY count DESC, last DESC LIMIT ?",
+                    (min_count, limit),
+                )
+            ]
+
+    def __len__(self) -> int:
+        with self.__cond:
+            return len(self.__pending) + len(self.__leased)
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+
+
+queue_db = RequestQueue("database/queue.db", legacy_path="database/queue.json")
 
 
 # Функция для добавления запроса в очередь
@@ -17,40 +177,368 @@ def add_request_to_queue(
     logger,
 ):
     logger.info(
-        f"Adding request: ans {answer} | g_id {group_id} | user {user_id} | q_len {len(queue_db.all()) + 1}"
+        f"Adding request: ans {answer} | g_id {group_id} | user {user_id} | q_len {len(queue_db) + 1}"
     )
 
-    queue_db.insert(
-        {"data": (answer, group_id, chat_id, full_name, message_queue_id, user_id)}
-    )
+    queue_db.record_pick(answer)
+    return queue_db.put((answer, group_id, chat_id, full_name, message_queue_id, user_id))
+
+
+class WorkerPool:
+    """N generation workers sharing one queue, with busy-time accounting.
 
+    Processing times feed a moving average, ``expected`` until the first
+    request is done, which ``estimates`` turns into waiting times.
+    """
 
-# Функция для обработки запросов из очереди
-def process_requests(process_func, logger, delay):
-    while True:
-        time.sleep(delay)
+    def __init__(
+        self, process_func, queue, workers=1, logger=None, delay=0, expected=30.0, smoothing=0.2
+    ):
+        self.process_func = process_func
+        self.queue = queue
+        self.workers = workers
+        self.logger = logger
+        self.delay = delay
+        self.smoothing = smoothing
+        self.__average = expected
+        self.__busy: dict[int, float] = {}
+        self.__busy_total = 0.0
+        self.__processed = 0
+        self.__started = time.monotonic()
+        self.__lock = threading.Lock()
+        self.__threads = []
 
-        # Получаем запрос из очереди
-        if queue_db.all():
-            request = queue_db.all()[0]["data"]
-            if request is None:
-                break  # Завершаем цикл при получении None из очереди
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self.__run, name=f"generation-worker-{number}"
+            )
+            thread.start()
+            self.__threads.append(thread)
+
+    # Функция для обработки запросов из очереди
+    def __run(self):
+        last_started = 0.0
+        while True:
+            # Ждём появления запроса в очереди
+            item = self.queue.get()
+            if item is None:
+                break  # Очередь закрыта
+            item_id, request = item
             answer, group_id, _, _, _, user_id = request
 
-            process_func(request)
+            # Минимальный интервал между генерациями одного воркера
+            wait = last_started + self.delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last_started = time.monotonic()
+
+            with self.__lock:
+                self.__busy[threading.get_ident()] = last_started
+            waited = self.queue.waited(item_id)
+            if waited is not None:
+                QUEUE_WAIT.observe(waited)
 
-            if logger is not None:
-                logger.info(
-                    f"Processing request: ans {answer} | g_id {group_id} | user {user_id}"
+            if self.logger is not None:
+                self.logger.info(
+                    f"Processing request: ans {answer} | g_id {group_id} | user {user_id} | {self.format_stats()}"
                 )
 
-            queue_db.remove(doc_ids=[queue_db.all()[0].doc_id])
+            try:
+                self.process_func(request)
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"ERROR: {e}")
+            finally:
+                with self.__lock:
+                    started = self.__busy.pop(threading.get_ident())
+                    took = time.monotonic() - started
+                    self.__busy_total += took
+                    self.__processed += 1
+                    # A plain mean of the first few, so the guess is soon forgotten
+                    weight = max(self.smoothing, 1 / self.__processed)
+                    self.__average += weight * (took - self.__average)
+                PROCESSING_TIME.observe(took)
+
+            self.queue.ack(item_id)
+
+    def idle(self) -> bool:
+        with self.__lock:
+            return not self.__busy and len(self.queue) == 0
+
+    def average(self) -> float:
+        with self.__lock:
+            return self.__average
+
+    def estimates(self, count: int) -> list:
+        """Seconds until each of the next ``count`` waiting requests is done.
+
+        Every worker takes the next request as soon as it is free, and every
+        request takes the moving average; a busy worker is free once its
+        current request has run for that long.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            average = self.__average
+            running = list(self.__busy.values())
+        free = [max(started + average - now, 0.0) for started in running]
+        free += [0.0] * max(self.workers - len(free), 0)
+        heapq.heapify(free)
+        result = []
+        for _ in range(count):
+            done = heapq.heappop(free) + average
+            heapq.heappush(free, done)
+            result.append(done)
+        return result
+
+    def stats(self) -> dict:
+        with self.__lock:
+            now = time.monotonic()
+            busy_time = self.__busy_total + sum(
+                now - started for started in self.__busy.values()
+            )
+            elapsed = max(now - self.__started, 1e-9)
+            return {
+                "queue_depth": len(self.queue) - len(self.__busy),
+                "workers": self.workers,
+                "busy_workers": len(self.__busy),
+                "utilisation": busy_time / (elapsed * self.workers),
+                "processed": self.__processed,
+                "average": self.__average,
+            }
 
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (
+            f"depth {stats['queue_depth']} | busy {stats['busy_workers']}/{stats['workers']}"
+            f" | util {stats['utilisation']:.0%}"
+        )
 
-def start_thread(f, logger=None, delay=60):
-    request_thread = threading.Thread(target=process_requests, args=[f, logger, delay])
-    request_thread.start()
+
+pool: WorkerPool | None = None
+
+registry.gauge(
+    "generation_queue_depth",
+    "Generation requests waiting or in progress",
+    func=lambda: len(queue_db),
+)
+registry.gauge(
+    "generation_busy_workers",
+    "Generation workers currently busy",
+    func=lambda: get_pool_stats().get("busy_workers", 0),
+)
+
+
+def start_thread(f, logger=None, delay=0, workers=1, expected=30.0):
+    global pool
+    pool = WorkerPool(
+        f, queue_db, workers=workers, logger=logger, delay=delay, expected=expected
+    )
+    pool.start()
 
 
 def get_queue_length():
-    return len(queue_db.all())
+    return len(queue_db)
+
+
+def estimate_next() -> tuple[int, float]:
+    """Position and expected wait, in seconds, of a request enqueued now."""
+    position = len(queue_db.waiting()) + 1
+    if pool is None:
+        return position, 0.0
+    return position, pool.estimates(position)[-1]
+
+
+def record_pick(word: str):
+    queue_db.record_pick(word)
+
+
+def get_pool_stats() -> dict:
+    if pool is None:
+        return {"queue_depth": len(queue_db), "workers": 0}
+    return pool.stats()
+
+
+class PreWarmer:
+    """Pre-generates images for the most picked words while the queue is idle.
+
+    It only spends quota the rate limiter has spare (keeping ``reserve`` tokens
+    for real requests) and keeps images for at most ``stock_size`` words. A
+    word whose generation failed is skipped for ``retry_after`` seconds.
+    """
+
+    def __init__(
+        self,
+        cache,
+        provider: str,
+        generate,
+        rate_limit=None,
+        stock_size: int = 50,
+        min_picks: int = 2,
+        interval: float = 30,
+        reserve: float = 1,
+        reuse: bool = True,
+        retry_after: float = 3600,
+        logger=None,
+    ):
+        self.cache = cache
+        self.provider = provider
+        self.generate = generate
+        self.rate_limit = rate_limit
+        self.stock_size = stock_size
+        self.min_picks = min_picks
+        self.interval = interval
+        self.reserve = reserve
+        self.reuse = reuse
+        self.retry_after = retry_after
+        self.logger = logger
+        self.__failed: dict[str, float] = {}
+        self.__stopped = threading.Event()
+
+    def is_stocked(self, word: str) -> bool:
+        return self.cache.contains(self.provider, word, unsent_only=not self.reuse)
+
+    def next_word(self) -> str | None:
+        now = time.monotonic()
+        self.__failed = {
+            word: retry_at for word, retry_at in self.__failed.items() if retry_at > now
+        }
+        for word in queue_db.top_picks(self.stock_size, self.min_picks):
+            if word not in self.__failed and not self.is_stocked(word):
+                return word
+        return None
+
+    def can_run(self) -> bool:
+        if pool is not None and not pool.idle():
+            return False
+        if len(queue_db) > 0:
+            return False
+        if self.rate_limit is None:
+            return True
+        # A bucket that cannot hold the reserve (capacity 1 below 120 rpm) is
+        # used once it is full, the queue being empty and the workers idle
+        return self.rate_limit.available >= min(self.rate_limit.capacity, 1 + self.reserve)
+
+    def run_once(self) -> bool:
+        if not self.can_run():
+            return False
+        word = self.next_word()
+        if word is None:
+            return False
+        status, _, _ = self.cache.get_or_generate(
+            self.provider, word, self.generate, reuse=self.reuse
+        )
+        if status != 200:
+            # A refused prompt would otherwise be picked again every round
+            self.__failed[word] = time.monotonic() + self.retry_after
+        if self.logger is not None:
+            self.logger.info(f"Pre-generated: ans {word} | status {status}")
+        return status == 200
+
+    def __run(self):
+        while not self.__stopped.wait(self.interval):
+            try:
+                # Keep going while there is spare quota, then sleep again
+                while not self.__stopped.is_set() and self.run_once():
+                    pass
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"ERROR: {e}")
+
+    def start(self):
+        threading.Thread(target=self.__run, name="prewarmer", daemon=True).start()
+
+    def stop(self):
+        self.__stopped.set()
+
+
+class QueueNotifier:
+    """Keeps the "you are in the queue" messages up to date.
+
+    Every ``interval`` seconds the waiting requests get a fresh position and
+    wait from ``format_message(position, seconds)``. Only messages whose text
+    changed are edited, each at most once per ``min_edit_interval``, and no
+    more than ``max_edits`` per round, front of the queue first. Edits go out
+    at low priority, after everything players are waiting for.
+    """
+
+    def __init__(
+        self,
+        outbox,
+        format_message,
+        interval: float = 5.0,
+        min_edit_interval: float = 20.0,
+        max_edits: int = 20,
+        logger=None,
+    ):
+        self.outbox = outbox
+        self.format_message = format_message
+        self.interval = interval
+        self.min_edit_interval = min_edit_interval
+        self.max_edits = max_edits
+        self.logger = logger
+        self.__shown: dict[int, tuple[str, float]] = {}
+        self.__lock = threading.Lock()
+        self.__edits = 0
+        self.__stopped = threading.Event()
+
+    def shown(self, item_id: int, text: str):
+        """Records the text a request's message was sent with."""
+        with self.__lock:
+            self.__shown[item_id] = (text, time.monotonic())
+
+    def run_once(self) -> int:
+        waiting = queue_db.waiting()
+        if pool is None or not waiting:
+            with self.__lock:
+                self.__shown.clear()
+            return 0
+        estimates = pool.estimates(len(waiting))
+        now = time.monotonic()
+        edits = []
+        ids = {item_id for item_id, _ in waiting}
+        with self.__lock:
+            # Requests that left the queue are forgotten
+            self.__shown = {
+                item_id: shown for item_id, shown in self.__shown.items() if item_id in ids
+            }
+            for position, ((item_id, request), seconds) in enumerate(
+                zip(waiting, estimates), start=1
+            ):
+                if len(edits) >= self.max_edits:
+                    break
+                message_id = request[4]
+                if message_id is None:
+                    continue
+                text = self.format_message(position, seconds)
+                shown, edited = self.__shown.get(item_id, (None, 0.0))
+                if text == shown or now - edited < self.min_edit_interval:
+                    continue
+                self.__shown[item_id] = (text, now)
+                edits.append((request[2], message_id, text))
+            self.__edits += len(edits)
+        for chat_id, message_id, text in edits:
+            # The worker may delete the message first; the failed edit is dropped
+            self.outbox.edit_message_text(
+                chat_id, message_id, text, priority=LOW, parse_mode="Markdown"
+            )
+        return len(edits)
+
+    def __run(self):
+        while not self.__stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"ERROR: {e}")
+
+    def start(self):
+        threading.Thread(target=self.__run, name="queue-notifier", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.__stopped.set()
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {"tracked": len(self.__shown), "edits": self.__edits}
@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.__tokens = self.capacity
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests: float, burst: float | None = None):
+        return cls(requests / 60, burst if burst is not None else max(1.0, requests / 60))
+
+    def __refill(self):
+        now = time.monotonic()
+        self.__tokens = min(
+            self.capacity, self.__tokens + (now - self.__updated) * self.rate
+        )
+        self.__updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self.__lock:
+            self.__refill()
+            if self.__tokens >= tokens:
+                self.__tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens: float = 1) -> float:
+        with self.__lock:
+            self.__refill()
+            return max(0.0, (tokens - self.__tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1, timeout: float | None = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire(tokens):
+            wait = self.wait_time(tokens)
+            if deadline is not None:
+                if time.monotonic() + wait > deadline:
+                    return False
+            time.sleep(wait)
+        return True
+
+    def penalize(self, seconds: float):
+        # Drain the bucket so nothing is sent for ``seconds`` (e.g. after a 429)
+        with self.__lock:
+            self.__refill()
+            self.__tokens = min(self.__tokens, 0.0) - seconds * self.rate
+
+    @property
+    def available(self) -> float:
+        with self.__lock:
+            self.__refill()
+            return self.__tokens
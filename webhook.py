@@ -0,0 +1,172 @@
+import hmac
+import json
+import queue
+import secrets
+import ssl
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot.types import Update
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receives updates pushed by Telegram instead of polling for them.
+
+    Only POSTs to ``path`` carrying ``secret_token`` in the secret header are
+    accepted. Updates wait in a queue of at most ``max_pending`` and are fed
+    to ``bot.process_new_updates`` in batches by one thread. When the queue
+    stays full for ``enqueue_timeout`` seconds the request is answered with
+    503, and Telegram delivers the update again later.
+    """
+
+    def __init__(
+        self,
+        bot,
+        host: str = "0.0.0.0",
+        port: int = 8443,
+        path: str = "/webhook",
+        secret_token: str | None = None,
+        max_pending: int = 1000,
+        enqueue_timeout: float = 1.0,
+        max_body: int = 1024 * 1024,
+        batch_size: int = 100,
+        certfile: str | None = None,
+        keyfile: str | None = None,
+        logger=None,
+    ):
+        self.bot = bot
+        self.path = path
+        # Telegram allows 1-256 characters of A-Z, a-z, 0-9, _ and -
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.enqueue_timeout = enqueue_timeout
+        self.max_body = max_body
+        self.batch_size = batch_size
+        self.certfile = certfile
+        self.logger = logger
+
+        self.__updates: queue.Queue = queue.Queue(max_pending)
+        self.__lock = threading.Lock()
+        self.__counts = {"accepted": 0, "rejected": 0, "overloaded": 0, "invalid": 0}
+        self.__stopped = threading.Event()
+
+        self.server = ThreadingHTTPServer((host, port), self.__handler())
+        self.server.daemon_threads = True
+        if certfile is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+
+    @property
+    def address(self) -> tuple:
+        return self.server.server_address[:2]
+
+    def __count(self, name: str):
+        with self.__lock:
+            self.__counts[name] += 1
+
+    def __handler(self):
+        webhook = self
+        count = self.__count
+        updates = self.__updates
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status: int, headers: dict | None = None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if self.path != webhook.path or not hmac.compare_digest(
+                    self.headers.get(SECRET_HEADER, ""), webhook.secret_token
+                ):
+                    count("rejected")
+                    self.close_connection = True
+                    return self.reply(403)
+                if length > webhook.max_body:
+                    count("invalid")
+                    self.close_connection = True
+                    return self.reply(413)
+                try:
+                    update = Update.de_json(json.loads(self.rfile.read(length)))
+                except (ValueError, KeyError, TypeError):
+                    count("invalid")
+                    # Telegram would only resend the same broken payload
+                    return self.reply(200)
+                try:
+                    updates.put(update, timeout=webhook.enqueue_timeout)
+                except queue.Full:
+                    count("overloaded")
+                    return self.reply(503, {"Retry-After": "1"})
+                count("accepted")
+                self.reply(200)
+
+            def do_GET(self):
+                self.reply(405)
+
+        return Handler
+
+    def __consume(self):
+        while not self.__stopped.is_set():
+            try:
+                batch = [self.__updates.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__updates.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.bot.process_new_updates(batch)
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"ERROR: {e}")
+
+    def start(self):
+        threading.Thread(target=self.__consume, name="webhook-consumer", daemon=True).start()
+        threading.Thread(
+            target=self.server.serve_forever, name="webhook-server", daemon=True
+        ).start()
+        return self
+
+    def register(self, url: str, max_connections: int = 40):
+        """Points Telegram at ``url``, which must reach this server's ``path``."""
+        certificate = None
+        if self.certfile is not None:
+            # Self-signed certificates have to be uploaded
+            certificate = open(self.certfile, "rb")
+        try:
+            self.bot.set_webhook(
+                url=url,
+                certificate=certificate,
+                max_connections=max_connections,
+                secret_token=self.secret_token,
+            )
+        finally:
+            if certificate is not None:
+                certificate.close()
+        if self.logger is not None:
+            self.logger.info(f"Webhook set to {url}")
+
+    def wait(self):
+        """Blocks until ``stop`` is called."""
+        self.__stopped.wait()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.__stopped.set()
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__counts, pending=self.__updates.qsize())